@@ -10,6 +10,9 @@ class Settings(BaseSettings):
     cas_enabled: bool = True
     max_hint_level: int = 3
     enable_llm: bool = True
+    llm_max_concurrency: int = 16
+    llm_cache_size: int = 10000
+    llm_cache_ttl_seconds: int = 86400
     vertex_project_id: str | None = None
     vertex_location: str = "asia-southeast1"
     google_api_key: str | None = None
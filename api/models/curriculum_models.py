@@ -65,6 +65,7 @@ class CurriculumQuestion:
         return {
             "question_id": self.question_id,
             "topic": self.topic,
+            "topic_lc": self.topic.lower(),  # Normalized for single-query topic lookups
             "subtopic": self.subtopic,
             "title": self.title,
             "learn_step": self.learn_step,
@@ -4,13 +4,30 @@ Designed for Singapore PSLE AI Tutor - Production Ready Schema
 """
 
 from typing import Dict, List, Optional, Any
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, fields
 from datetime import datetime, timezone
 import uuid
 
 
+def _to_iso(value: Any) -> Any:
+    """Normalize Firestore server timestamps (datetime subclasses) to the ISO strings the models use"""
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+_TIMESTAMP_FIELDS = ('created_at', 'updated_at', 'started_at', 'completed_at', 'last_message_at')
+
+
+class _TimestampNormalizer:
+    """Accept either native Firestore Timestamps or ISO strings for timestamp fields"""
+    
+    def __post_init__(self):
+        for name in _TIMESTAMP_FIELDS:
+            if hasattr(self, name):
+                setattr(self, name, _to_iso(getattr(self, name)))
+
+
 @dataclass 
-class FirestoreUser:
+class FirestoreUser(_TimestampNormalizer):
     """
     Complete user profile in single document
     Collection: /users/{userId}
@@ -51,7 +68,7 @@ class FirestoreUser:
 
 
 @dataclass
-class FirestoreLearner:
+class FirestoreLearner(_TimestampNormalizer):
     """
     Complete learner profile and progress in single document
     Collection: /learners/{learnerId}
@@ -77,7 +94,7 @@ class FirestoreLearner:
     # Session Management
     current_session_id: Optional[str]
     total_sessions: int
-    total_time_spent: int  # minutes
+    total_time_spent: int  # seconds, summed from finished sessions
     
     # Analytics
     performance_stats: Dict[str, Any]
@@ -135,7 +152,7 @@ class FirestoreLearner:
 
 
 @dataclass
-class FirestoreSession:
+class FirestoreSession(_TimestampNormalizer):
     """
     Complete tutoring session with full conversation history
     Collection: /sessions/{sessionId}
@@ -153,7 +170,7 @@ class FirestoreSession:
     finished: bool
     success: bool
     
-    # Conversation History (Full context for AI)
+    # Conversation History (legacy inline array; new entries live in /sessions/{sessionId}/messages)
     conversation_history: List[Dict[str, Any]]
     
     # Learning Analytics
@@ -171,6 +188,7 @@ class FirestoreSession:
     completed_at: Optional[str]
     created_at: str
     updated_at: str
+    last_message_at: Optional[str] = None
     
     @classmethod
     def create_new(cls, learner_id: str, item_id: str, subject: str, module_id: str) -> 'FirestoreSession':
@@ -247,11 +265,25 @@ class FirestoreCurriculumItem:
         return asdict(self)
 
 
+# Field names per model, computed once so reads can drop unknown server-side fields
+_FIELD_NAMES = {
+    model: frozenset(f.name for f in fields(model))
+    for model in (FirestoreUser, FirestoreLearner, FirestoreSession, FirestoreCurriculumItem)
+}
+
+
+def from_firestore(model, data: Dict[str, Any]):
+    """Build a model from a Firestore document dict, ignoring fields the model doesn't declare"""
+    names = _FIELD_NAMES[model]
+    return model(**{k: v for k, v in data.items() if k in names})
+
+
 # Firestore Collection References
 COLLECTIONS = {
     'users': 'users',
     'learners': 'learners', 
     'sessions': 'sessions',
+    'session_messages': 'messages',  # Subcollection: /sessions/{sessionId}/messages
     'curriculum_questions': 'curriculum_questions',  # Flat collection containing all questions
     'curriculum_algebra': 'curriculum/algebra/items',
     'curriculum_fractions': 'curriculum/fractions/items',
@@ -266,6 +298,7 @@ COLLECTIONS = {
 QUERY_PATTERNS = {
     'learner_by_parent': 'learners where parent_id == parent_id',
     'learner_sessions': 'sessions where learner_id == learner_id order by started_at desc',
+    'session_messages': 'sessions/{session_id}/messages order by timestamp desc limit N',
     'current_session': 'sessions where learner_id == learner_id and finished == false',
     'curriculum_by_subject': 'curriculum/{subject}/items order by learn_step asc',
     'learner_progress': 'single document read from learners/{learner_id}',
@@ -118,3 +118,20 @@ def get_curriculum_status(request: Request):
             status_code=500,
             detail=f"Failed to get curriculum status: {str(e)}"
         )
+
+
+@router.get("/admin/curriculum/diagnose")
+async def diagnose_curriculum(request: Request, sample_size: int = 5):
+    _check_admin(request)
+    """
+    Inspect a sample of curriculum documents (field names, topic values)
+    """
+    try:
+        firestore_repo = get_firestore_repository()
+        return await firestore_repo.diagnose_curriculum(sample_size)
+    except Exception as e:
+        logger.error(f"Error diagnosing curriculum: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to diagnose curriculum: {str(e)}"
+        )
@@ -1,4 +1,8 @@
+import json
+import logging
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from typing import Optional
 from models.schemas import (
     SessionStartRequest,
@@ -11,6 +15,7 @@ from models.schemas import (
 from services.container import ITEMS_REPO, SESSIONS_REPO, PROFILES_REPO, PROGRESSION_SERVICE
 from services.orchestrator import SimpleOrchestrator
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
 _ORCH = SimpleOrchestrator()
 
@@ -19,10 +24,8 @@ _ORCH = SimpleOrchestrator()
 
 def _extract_topic_from_request(req) -> str:
     """Extract topic from request item_id - FAIL if not found."""
-    print(f"🔍 DEBUG: Request has item_id: {getattr(req, 'item_id', 'NO ITEM_ID')}")
-    
     if not hasattr(req, 'item_id') or not req.item_id:
-        print(f"🔍 DEBUG: No item_id provided in request")
+        logger.debug("No item_id provided in request")
         raise HTTPException(status_code=400, detail="item_id is required")
     
     return _extract_topic_from_item_id(req.item_id)
@@ -48,14 +51,14 @@ def _extract_topic_from_item_id(item_id: str) -> str:
         raise HTTPException(status_code=400, detail="item_id cannot be empty")
         
     item_id_lower = item_id.lower()
-    print(f"🔍 DEBUG: Looking up topic for item_id '{item_id_lower}'")
+    logger.debug("Looking up topic for item_id '%s'", item_id_lower)
     
     try:
         # Get the question from hybrid ITEMS_REPO (loaded from Firestore at startup)
         question = ITEMS_REPO.get_item(item_id)
         if question:
             topic = question.get("topic", "")
-            print(f"🔍 DEBUG: Found topic from hybrid repo: '{item_id}' → '{topic}'")
+            logger.debug("Found topic from hybrid repo: '%s' -> '%s'", item_id, topic)
             return topic
         
         # If question not found, try to infer topic from item_id patterns
@@ -74,21 +77,21 @@ def _extract_topic_from_item_id(item_id: str) -> str:
         for topic, keywords in topic_patterns.items():
             for keyword in keywords:
                 if keyword in item_id_lower:
-                    print(f"🔍 DEBUG: Inferred topic from pattern: '{item_id}' → '{topic}'")
+                    logger.debug("Inferred topic from pattern: '%s' -> '%s'", item_id, topic)
                     return topic
         
         # Last resort: check if it's a direct topic match
         known_topics = list(topic_patterns.keys())
         for topic in known_topics:
             if topic.replace('-', '') in item_id_lower or topic in item_id_lower:
-                print(f"🔍 DEBUG: Direct topic match: '{item_id}' → '{topic}'")
+                logger.debug("Direct topic match: '%s' -> '%s'", item_id, topic)
                 return topic
     
     except Exception as e:
-        print(f"🔍 DEBUG: Error looking up topic: {e}")
+        logger.debug("Error looking up topic: %s", e)
     
     # Fail clearly if topic can't be determined
-    print(f"🔍 DEBUG: Could not determine topic from item_id '{item_id}'")
+    logger.debug("Could not determine topic from item_id '%s'", item_id)
     raise HTTPException(status_code=400, detail=f"Cannot determine topic from item_id: {item_id}. Question may not exist in curriculum database.")
 
 
@@ -152,43 +155,40 @@ def get_session(session_id: str):
 @router.post("/session/start-adaptive", response_model=SessionStartResponse)
 def start_adaptive_session(req: AdaptiveSessionStartRequest):
     """Start an adaptive session that progresses through any math topic."""
-    print(f"🔍 DEBUG: start_adaptive_session called with learner_id={req.learner_id}, item_id={getattr(req, 'item_id', None)}")
+    logger.debug("start_adaptive_session called with learner_id=%s, item_id=%s",
+                 req.learner_id, getattr(req, 'item_id', None))
     
     learner_profile = PROFILES_REPO.get_profile(req.learner_id)
     
     # Detect topic from request
     topic_name = _extract_topic_from_request(req)
-    print(f"🔍 DEBUG: Detected topic: {topic_name}")
-    
-    # Try both lowercase and capitalized versions for Firestore query
-    topic_variations = [topic_name, topic_name.capitalize(), topic_name.upper()]
-    print(f"🔍 DEBUG: Will try topic variations: {topic_variations}")
+    logger.debug("Detected topic: %s", topic_name)
     
     # If item_id is provided, use it; otherwise find next in progression
     item_id = req.item_id
-    print(f"🔍 DEBUG: Original item_id from request: {item_id}")
     
     # FIRST: Check if item_id is a subtopic identifier BEFORE any legacy mapping
     subtopic_filter = None
     if item_id:
         subtopic_filter = _extract_subtopic_from_item_id(item_id)
         if subtopic_filter:
-            print(f"🔍 DEBUG: Detected subtopic identifier '{item_id}' -> filter: '{subtopic_filter}'")
+            logger.debug("Detected subtopic identifier '%s' -> filter: '%s'", item_id, subtopic_filter)
             # Get first question from this specific subtopic
             item_id = PROGRESSION_SERVICE.recommend_next_session(learner_profile, topic_name, subtopic_filter)
-            print(f"🔍 DEBUG: Recommended item_id for subtopic '{subtopic_filter}': {item_id}")
+            logger.debug("Recommended item_id for subtopic '%s': %s", subtopic_filter, item_id)
             if not item_id:
                 raise HTTPException(status_code=404, detail=f"No more items available in {topic_name} subtopic '{subtopic_filter}' progression")
         else:
             # No subtopic filter detected, continue with original item_id
-            print(f"🔍 DEBUG: No subtopic detected, using original item_id: {item_id}")
+            logger.debug("No subtopic detected, using original item_id: %s", item_id)
     
     if not item_id:
-        print(f"🔍 DEBUG: No item_id, getting recommendation for topic '{topic_name}' with subtopic_filter '{subtopic_filter}'")
+        logger.debug("No item_id, getting recommendation for topic '%s' with subtopic_filter '%s'",
+                     topic_name, subtopic_filter)
         # Use progression service to get next question in progression (more reliable than curriculum service)
         # CRITICAL FIX: Pass subtopic_filter to maintain subtopic filtering context
         item_id = PROGRESSION_SERVICE.recommend_next_session(learner_profile, topic_name, subtopic_filter)
-        print(f"🔍 DEBUG: Recommended item_id: {item_id}")
+        logger.debug("Recommended item_id: %s", item_id)
         if not item_id:
             raise HTTPException(status_code=404, detail=f"No more items available in {topic_name} progression")
     
@@ -223,7 +223,48 @@ def start_adaptive_session(req: AdaptiveSessionStartRequest):
 
 
 @router.post("/session/step", response_model=SessionStepResponse)
-def do_step(req: SessionStepRequest):
+async def do_step(req: SessionStepRequest):
+    # Repository calls are blocking, so they run in the threadpool; only the
+    # LLM evaluation is awaited on the event loop
+    session, item, early_response = await run_in_threadpool(_begin_step, req)
+    if early_response:
+        return early_response
+    
+    # Evaluate using new simplified structure
+    correctness, next_prompt, hint, evaluation_data = await _ORCH.evaluate_simplified_async(
+        req.user_response, item, session.get("attempts_current", 0), session)
+    return await run_in_threadpool(_finish_step, req, session, item, correctness, next_prompt, hint, evaluation_data)
+
+
+@router.post("/session/step/stream")
+async def do_step_stream(req: SessionStepRequest):
+    """Same as /session/step, but streams the tutor reply as server-sent events.
+
+    Emits `delta` events with partial feedback text, then one `result` event
+    carrying the SessionStepResponse.
+    """
+    session, item, early_response = await run_in_threadpool(_begin_step, req)
+
+    async def events():
+        if early_response:
+            yield _sse("result", early_response.model_dump_json())
+            return
+        async for kind, payload in _ORCH.evaluate_simplified_stream(
+                req.user_response, item, session.get("attempts_current", 0), session):
+            if kind == "delta":
+                yield _sse("delta", json.dumps({"text": payload}))
+            else:
+                response = await run_in_threadpool(_finish_step, req, session, item, *payload)
+                yield _sse("result", response.model_dump_json())
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def _sse(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+def _begin_step(req: SessionStepRequest):
     session = SESSIONS_REPO.get(req.session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -231,15 +272,16 @@ def do_step(req: SessionStepRequest):
     
     finished = session.get("finished", False)
     if finished:
-        return SessionStepResponse(correctness=True, next_prompt=None, hint=None, updates={}, finished=True, step_id=None)
+        return session, item, SessionStepResponse(correctness=True, next_prompt=None, hint=None, updates={}, finished=True, step_id=None)
     
     # Add student response to conversation history
     SESSIONS_REPO.add_to_conversation(req.session_id, "student", req.user_response, 
                                     {"step_id": "main", "attempt": session.get("attempts_current", 0) + 1})
-    
-    # Evaluate using new simplified structure
-    correctness, next_prompt, hint, evaluation_data = _ORCH.evaluate_simplified(req.user_response, item, 
-                                                                               session.get("attempts_current", 0), session)
+    return session, item, None
+
+
+def _finish_step(req: SessionStepRequest, session: dict, item: dict, correctness, next_prompt, hint,
+                 evaluation_data: dict) -> SessionStepResponse:
     SESSIONS_REPO.append_step(req.session_id, {"step_id": "main", "response": req.user_response, "correct": correctness})
     
     # Store learning insight if provided
@@ -275,10 +317,10 @@ def do_step(req: SessionStepRequest):
         
         # Check if this is the final answer (based on AI evaluation, not step count)
         # If AI says should_advance and correctness is True, complete the item
-        SESSIONS_REPO.mark_finished(req.session_id)
+        learner_id = session["learner_id"]
+        SESSIONS_REPO.mark_finished(req.session_id, learner_id, session.get("started_at"))
         
         # Mark item as completed in learner profile
-        learner_id = session["learner_id"]
         item_id = session["item_id"]
         PROFILES_REPO.mark_item_completed(learner_id, item_id)
         PROFILES_REPO.clear_current_session(learner_id)
@@ -298,10 +340,11 @@ def do_step(req: SessionStepRequest):
         # Now using hybrid repo which loads from Firestore at startup
         completed_item = ITEMS_REPO.get_item(item_id)
         subtopic_filter = completed_item.get("subtopic") if completed_item else None
-        print(f"🔍 DEBUG: Looking for next item in topic '{topic_name}' subtopic '{subtopic_filter}' after completing '{item_id}'")
-        print(f"🔍 DEBUG: Learner completed items: {learner_profile.get('completed_items', [])}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Looking for next item in topic '%s' subtopic '%s' after completing '%s' (%d completed)",
+                         topic_name, subtopic_filter, item_id, len(learner_profile.get('completed_items', [])))
         next_item_id = PROGRESSION_SERVICE.recommend_next_session(learner_profile, topic_name, subtopic_filter)
-        print(f"🔍 DEBUG: Progression service recommended: {next_item_id}")
+        logger.debug("Progression service recommended: %s", next_item_id)
         
         if next_item_id:
             next_item = ITEMS_REPO.get_item(next_item_id)
@@ -367,7 +410,7 @@ def continue_progression(req: SessionEndRequest):
     # CRITICAL FIX: Extract subtopic from current item to maintain subtopic filtering
     current_item = ITEMS_REPO.get_item(current_item_id)
     subtopic_filter = current_item.get("subtopic") if current_item else None
-    print(f"🔍 DEBUG: continue-progression topic '{topic_name}' subtopic '{subtopic_filter}'")
+    logger.debug("continue-progression topic '%s' subtopic '%s'", topic_name, subtopic_filter)
     next_item_id = PROGRESSION_SERVICE.recommend_next_session(learner_profile, topic_name, subtopic_filter)
     if not next_item_id:
         raise HTTPException(status_code=404, detail="No more items available in progression")
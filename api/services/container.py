@@ -1,4 +1,4 @@
-from services.repositories import InMemorySessionsRepo, InMemoryProfilesRepo, InMemoryParentsRepo
+from services.repositories import InMemorySessionsRepo, InMemoryProfilesRepo, InMemoryParentsRepo, build_topic_index
 from services.firestore_repository import get_firestore_repository
 from services.progression import ProgressionService
 from models.curriculum_models import COLLECTIONS
@@ -6,6 +6,7 @@ from core.config import settings
 import os
 import logging
 import asyncio
+from datetime import datetime, timezone
 
 logger = logging.getLogger(__name__)
 
@@ -56,8 +57,10 @@ def init_repositories():
         class EmptyItemsRepo:
             def __init__(self):
                 self._cache = {}
+                self.version = 0
             def get_item(self, item_id): return None
             def get_all_items(self): return {}
+            def get_topic_item_ids(self, topic): return []
             def put_item(self, item): pass
         
         return {
@@ -72,6 +75,9 @@ class HybridItemsRepo:
     def __init__(self, firestore_repo):
         self.firestore = firestore_repo
         self._cache = {}
+        self.version = 0  # bumped on every load/mutation so derived caches can invalidate
+        self._topic_index = {}
+        self._topic_index_version = -1
         self._load_from_firestore()
         
     def _load_from_firestore(self):
@@ -96,6 +102,7 @@ class HybridItemsRepo:
             print(f"❌ ERROR loading from Firestore: {e}")
             print("💾 Falling back to empty cache")
             self._cache = {}
+        self.version += 1
     
     def get_item(self, item_id: str) -> dict:
         """Get item from memory cache (fast)"""
@@ -105,12 +112,23 @@ class HybridItemsRepo:
         """Get all items from memory cache (fast)"""
         return self._cache.copy()
     
+    def get_topic_item_ids(self, topic: str) -> list:
+        """Item ids for a topic via the prebuilt index (rebuilt only after loads/puts)"""
+        if self._topic_index_version != self.version:
+            self._topic_index = build_topic_index(self._cache)
+            self._topic_index_version = self.version
+        return list(self._topic_index.get(topic.lower(), []))
+    
     def put_item(self, item: dict):
         """Store item to both Firestore and memory cache"""
         item_id = item.get('id')
         if not item_id:
             raise ValueError("Item must have an 'id' field")
             
+        # Normalized topic for single-query lookups (see get_curriculum_by_subject)
+        if item.get('topic'):
+            item['topic_lc'] = item['topic'].lower()
+            
         # Store to Firestore
         try:
             doc_ref = self.firestore.db.collection(COLLECTIONS['curriculum_questions']).document(item_id)
@@ -121,6 +139,7 @@ class HybridItemsRepo:
             
         # Update memory cache
         self._cache[item_id] = item
+        self.version += 1
         print(f"✅ Stored {item_id} to both Firestore and cache")
         
     def refresh_cache(self):
@@ -139,6 +158,20 @@ class HybridItemsRepo:
             asyncio.set_event_loop(loop)
             return loop.run_until_complete(coro)
 
+def _seconds_since(started_at) -> int:
+    """Whole seconds elapsed since an ISO (or datetime) start time; 0 if it is missing or unparseable."""
+    if isinstance(started_at, str):
+        try:
+            started_at = datetime.fromisoformat(started_at)
+        except ValueError:
+            return 0
+    if not isinstance(started_at, datetime):
+        return 0
+    if started_at.tzinfo is None:
+        started_at = started_at.replace(tzinfo=timezone.utc)
+    return max(0, int((datetime.now(timezone.utc) - started_at).total_seconds()))
+
+
 class FirestoreSessionsRepo:
     def __init__(self, firestore_repo):
         self.firestore = firestore_repo
@@ -150,7 +183,12 @@ class FirestoreSessionsRepo:
         
     def get(self, session_id: str) -> dict:
         session = self._sync_call(self.firestore.get_session(session_id))
-        return session.__dict__ if session else None
+        if not session:
+            return None
+        data = session.__dict__
+        # Conversation lives in the messages subcollection; hydrate recent entries for AI context
+        data['conversation_history'] = self.get_conversation_history(session_id)
+        return data
         
     def append_step(self, session_id: str, step: dict):
         pass  # Will implement with proper Firestore update
@@ -161,12 +199,22 @@ class FirestoreSessionsRepo:
     def advance_step(self, session_id: str):
         pass  # Will implement with proper state management
         
-    def mark_finished(self, session_id: str):
-        self._sync_call(self.firestore.finish_session(session_id, True, 1.0))
+    def mark_finished(self, session_id: str, learner_id: str = None, started_at=None):
+        # Callers normally pass both from the session they already hold; read them only if they don't
+        if not learner_id:
+            started = self._sync_call(self.firestore.get_session_start(session_id)) or {}
+            learner_id = started.get('learner_id')
+            started_at = started_at or started.get('started_at')
+        if learner_id:
+            self._sync_call(self.firestore.finish_session(session_id, learner_id, True, 1.0,
+                                                          _seconds_since(started_at)))
         
     def add_to_conversation(self, session_id: str, role: str, message: str, metadata: dict = None):
         self._sync_call(self.firestore.add_to_conversation(session_id, role, message, metadata))
         
+    def get_conversation_history(self, session_id: str, limit: int = 10) -> list:
+        return self._sync_call(self.firestore.get_conversation_history(session_id, limit))
+        
     def add_learning_insight(self, session_id: str, insight: str, confidence: float = 1.0):
         pass  # Will implement with array union
         
@@ -30,12 +30,9 @@ class CurriculumService:
         Get a specific question by ID
         Uses caching for performance
         """
-        print(f"🔍 DEBUG: CurriculumService.get_question called with ID: {question_id}")
-        
         # Check cache first
-        if question_id in self._question_cache:
-            cached_question = self._question_cache[question_id]
-            print(f"🔍 DEBUG: Found in cache - topic: {cached_question.get('topic', 'NO_TOPIC')}, title: {cached_question.get('title', 'NO_TITLE')}")
+        cached_question = self._question_cache.get(question_id)
+        if cached_question is not None:
             return cached_question
             
         try:
@@ -43,22 +40,19 @@ class CurriculumService:
             doc = doc_ref.get()
             
             if not doc.exists:
-                print(f"🔍 DEBUG: Question document does not exist: {question_id}")
                 logger.warning(f"Question not found: {question_id}")
                 return None
                 
             question_data = doc.to_dict()
-            print(f"🔍 DEBUG: Retrieved from Firestore - topic: {question_data.get('topic', 'NO_TOPIC')}, title: {question_data.get('title', 'NO_TITLE')}")
-            print(f"🔍 DEBUG: Problem text preview: {question_data.get('problem_text', 'NO_PROBLEM_TEXT')[:100]}...")
-            
             # Cache for future requests
             self._question_cache[question_id] = question_data
             
-            logger.debug(f"Retrieved question: {question_id}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Retrieved question %s - topic: %s, title: %s", question_id,
+                             question_data.get('topic', 'NO_TOPIC'), question_data.get('title', 'NO_TITLE'))
             return question_data
             
         except Exception as e:
-            print(f"🔍 DEBUG: Error retrieving question {question_id}: {e}")
             logger.error(f"Error retrieving question {question_id}: {e}")
             return None
 
@@ -4,6 +4,7 @@ Production-ready data access layer with error handling and optimization
 """
 
 from typing import Dict, List, Optional, Any
+from dataclasses import asdict
 from datetime import datetime, timezone
 import uuid
 import logging
@@ -12,6 +13,7 @@ from contextlib import asynccontextmanager
 try:
     from google.cloud import firestore
     from google.cloud.firestore import Client as FirestoreClient
+    from google.cloud.firestore_v1.field_path import FieldPath
     from google.api_core import exceptions
     FIRESTORE_AVAILABLE = True
 except ImportError:
@@ -23,12 +25,35 @@ from models.firestore_models import (
     FirestoreLearner, 
     FirestoreSession, 
     FirestoreCurriculumItem,
-    COLLECTIONS
+    COLLECTIONS,
+    from_firestore
 )
 
 logger = logging.getLogger(__name__)
 
 
+def _misconception_field(tag: str, field: str) -> str:
+    """Escaped update path for misconceptions.<tag>.<field>.
+
+    Tags come from the LLM, so a '.', backtick or space must stay inside the tag's
+    own map key rather than being read as a path separator.
+    """
+    return FieldPath('misconceptions', tag, field).to_api_repr()
+
+
+def _misconception_updates(misconception_tags: List[str], confidence: float) -> Dict[str, Any]:
+    """Increment/timestamp updates for each distinct, non-blank tag"""
+    updates = {}
+    for tag in dict.fromkeys(tag.strip() for tag in misconception_tags if isinstance(tag, str)):
+        if not tag:
+            continue
+        updates[_misconception_field(tag, 'count')] = firestore.Increment(1)
+        updates[_misconception_field(tag, 'last_seen')] = firestore.SERVER_TIMESTAMP
+        # Running sum rather than ArrayUnion, which would collapse repeated scores
+        updates[_misconception_field(tag, 'confidence_sum')] = firestore.Increment(confidence)
+    return updates
+
+
 class FirestoreRepository:
     """
     Production Firestore repository with comprehensive error handling
@@ -59,18 +84,10 @@ class FirestoreRepository:
         """Create new user with proper error handling"""
         try:
             user = FirestoreUser.create_new(user_id, email, name, role)
-            # Convert dataclass to dict for Firestore
-            user_data = {
-                'user_id': user.user_id,
-                'email': user.email, 
-                'name': user.name,
-                'role': user.role,
-                'profile': user.profile,
-                'children_ids': user.children_ids,
-                'students_ids': user.students_ids,
-                'created_at': user.created_at,
-                'updated_at': user.updated_at
-            }
+            # Convert dataclass to dict for Firestore; timestamps are assigned server-side
+            user_data = asdict(user)
+            user_data['created_at'] = firestore.SERVER_TIMESTAMP
+            user_data['updated_at'] = firestore.SERVER_TIMESTAMP
             self.users.document(user_id).set(user_data)
             logger.info(f"Created user: {user_id}")
             return user
@@ -85,7 +102,7 @@ class FirestoreRepository:
             if not doc.exists:
                 return None
             data = doc.to_dict()
-            return FirestoreUser(**data)
+            return from_firestore(FirestoreUser, data)
         except Exception as e:
             logger.error(f"Failed to get user {user_id}: {e}")
             return None
@@ -93,7 +110,7 @@ class FirestoreRepository:
     async def update_user(self, user_id: str, updates: Dict[str, Any]) -> bool:
         """Update user with timestamp tracking"""
         try:
-            updates['updated_at'] = datetime.now(timezone.utc).isoformat()
+            updates['updated_at'] = firestore.SERVER_TIMESTAMP
             self.users.document(user_id).update(updates)
             logger.info(f"Updated user: {user_id}")
             return True
@@ -107,45 +124,26 @@ class FirestoreRepository:
         """Create new learner and link to parent"""
         learner_id = str(uuid.uuid4())
         try:
-            # Ensure parent user exists first - if not, this is an error condition
-            parent_doc = self.users.document(parent_id).get()
-            if not parent_doc.exists:
-                logger.error(f"Parent user {parent_id} not found - user must register first")
-                raise ValueError(f"Parent user {parent_id} not found. Please complete user registration first.")
-            
             # Create learner document
             learner = FirestoreLearner.create_new(learner_id, parent_id, name, grade_level)
-            # Convert dataclass to dict for Firestore
-            learner_data = {
-                'learner_id': learner.learner_id,
-                'parent_id': learner.parent_id,
-                'teacher_ids': learner.teacher_ids,
-                'name': learner.name,
-                'grade_level': learner.grade_level,
-                'subjects': learner.subjects,
-                'learning_style': learner.learning_style,
-                'xp': learner.xp,
-                'level': learner.level,
-                'streaks': learner.streaks,
-                'badges': learner.badges,
-                'completed_items': learner.completed_items,
-                'mastery_scores': learner.mastery_scores,
-                'current_session_id': learner.current_session_id,
-                'total_sessions': learner.total_sessions,
-                'total_time_spent': learner.total_time_spent,
-                'performance_stats': learner.performance_stats,
-                'misconceptions': learner.misconceptions,
-                'learning_insights': learner.learning_insights,
-                'created_at': learner.created_at,
-                'updated_at': learner.updated_at
-            }
-            self.learners.document(learner_id).set(learner_data)
-            
-            # Add learner to parent's children list
-            self.users.document(parent_id).update({
+            # Convert dataclass to dict for Firestore; timestamps are assigned server-side
+            learner_data = asdict(learner)
+            learner_data['created_at'] = firestore.SERVER_TIMESTAMP
+            learner_data['updated_at'] = firestore.SERVER_TIMESTAMP
+
+            # Write learner and link to parent atomically. update() carries an
+            # exists precondition, so a missing parent aborts the whole batch.
+            batch = self.db.batch()
+            batch.set(self.learners.document(learner_id), learner_data)
+            batch.update(self.users.document(parent_id), {
                 'children_ids': firestore.ArrayUnion([learner_id]),
-                'updated_at': datetime.now(timezone.utc).isoformat()
+                'updated_at': firestore.SERVER_TIMESTAMP
             })
+            try:
+                batch.commit()
+            except exceptions.NotFound:
+                logger.error(f"Parent user {parent_id} not found - user must register first")
+                raise ValueError(f"Parent user {parent_id} not found. Please complete user registration first.")
             
             logger.info(f"Created learner: {learner_id} for parent: {parent_id}")
             return learner
@@ -161,7 +159,7 @@ class FirestoreRepository:
             if not doc.exists:
                 return None
             data = doc.to_dict()
-            return FirestoreLearner(**data)
+            return from_firestore(FirestoreLearner, data)
         except Exception as e:
             logger.error(f"Failed to get learner {learner_id}: {e}")
             return None
@@ -174,7 +172,7 @@ class FirestoreRepository:
             learners = []
             for doc in docs:
                 data = doc.to_dict()
-                learners.append(FirestoreLearner(**data))
+                learners.append(from_firestore(FirestoreLearner, data))
             return learners
         except Exception as e:
             logger.error(f"Failed to get learners for parent {parent_id}: {e}")
@@ -183,7 +181,7 @@ class FirestoreRepository:
     async def update_learner_progress(self, learner_id: str, updates: Dict[str, Any]) -> bool:
         """Update learner progress efficiently"""
         try:
-            updates['updated_at'] = datetime.now(timezone.utc).isoformat()
+            updates['updated_at'] = firestore.SERVER_TIMESTAMP
             self.learners.document(learner_id).update(updates)
             logger.debug(f"Updated learner progress: {learner_id}")
             return True
@@ -196,7 +194,7 @@ class FirestoreRepository:
         try:
             self.learners.document(learner_id).update({
                 'xp': firestore.Increment(amount),
-                'updated_at': datetime.now(timezone.utc).isoformat()
+                'updated_at': firestore.SERVER_TIMESTAMP
             })
             return True
         except Exception as e:
@@ -234,7 +232,7 @@ class FirestoreRepository:
                         'completed_items': completed_items,
                         'mastery_scores': mastery_scores,
                         'level': new_level,
-                        'updated_at': datetime.now(timezone.utc).isoformat()
+                        'updated_at': firestore.SERVER_TIMESTAMP
                     })
             
             learner_ref = self.learners.document(learner_id)
@@ -252,30 +250,10 @@ class FirestoreRepository:
         """Create new tutoring session"""
         try:
             session = FirestoreSession.create_new(learner_id, item_id, subject, module_id)
-            # Convert dataclass to dict for Firestore
-            session_data = {
-                'session_id': session.session_id,
-                'learner_id': session.learner_id,
-                'item_id': session.item_id,
-                'subject': session.subject,
-                'module_id': session.module_id,
-                'current_step_idx': session.current_step_idx,
-                'attempts_current': session.attempts_current,
-                'hints_used': session.hints_used,
-                'finished': session.finished,
-                'success': session.success,
-                'conversation_history': session.conversation_history,
-                'learning_insights': session.learning_insights,
-                'misconceptions': session.misconceptions,
-                'total_time_spent': session.total_time_spent,
-                'steps_completed': session.steps_completed,
-                'final_accuracy': session.final_accuracy,
-                'hint_efficiency': session.hint_efficiency,
-                'started_at': session.started_at,
-                'completed_at': session.completed_at,
-                'created_at': session.created_at,
-                'updated_at': session.updated_at
-            }
+            # Convert dataclass to dict for Firestore; timestamps are assigned server-side
+            session_data = asdict(session)
+            session_data['created_at'] = firestore.SERVER_TIMESTAMP
+            session_data['updated_at'] = firestore.SERVER_TIMESTAMP
             self.sessions.document(session.session_id).set(session_data)
             
             # Update learner's current session
@@ -297,96 +275,105 @@ class FirestoreRepository:
             if not doc.exists:
                 return None
             data = doc.to_dict()
-            return FirestoreSession(**data)
+            return from_firestore(FirestoreSession, data)
         except Exception as e:
             logger.error(f"Failed to get session {session_id}: {e}")
             return None
     
+    async def get_session_start(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Get only a session's learner_id and started_at (projected read, skips conversation data)"""
+        try:
+            doc = self.sessions.document(session_id).get(field_paths=['learner_id', 'started_at'])
+            if not doc.exists:
+                return None
+            return doc.to_dict() or {}
+        except Exception as e:
+            logger.error(f"Failed to get start of session {session_id}: {e}")
+            return None
+    
     async def add_to_conversation(self, session_id: str, role: str, message: str, 
                                   metadata: Optional[Dict[str, Any]] = None) -> bool:
-        """Add message to conversation history"""
+        """Append message to the session's messages subcollection"""
         try:
+            session_ref = self.sessions.document(session_id)
             entry = {
-                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "timestamp": firestore.SERVER_TIMESTAMP,
                 "role": role,
                 "message": message,
                 "metadata": metadata or {}
             }
             
-            self.sessions.document(session_id).update({
-                'conversation_history': firestore.ArrayUnion([entry]),
-                'updated_at': datetime.now(timezone.utc).isoformat()
+            # One small document per message keeps appends O(1) instead of
+            # rewriting an ever-growing array on the session document;
+            # message and session touch go out in a single batched commit
+            batch = self.db.batch()
+            batch.set(session_ref.collection(COLLECTIONS['session_messages']).document(), entry)
+            batch.update(session_ref, {
+                'last_message_at': firestore.SERVER_TIMESTAMP,
+                'updated_at': firestore.SERVER_TIMESTAMP
             })
+            batch.commit()
             return True
             
         except Exception as e:
             logger.error(f"Failed to add conversation entry to {session_id}: {e}")
             return False
     
+    async def get_conversation_history(self, session_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get the most recent conversation entries in chronological order"""
+        try:
+            docs = (self.sessions.document(session_id)
+                    .collection(COLLECTIONS['session_messages'])
+                    .order_by('timestamp', direction=firestore.Query.DESCENDING)
+                    .limit(limit)
+                    .get())
+            history = [doc.to_dict() for doc in docs]
+            history.reverse()
+            return history
+        except Exception as e:
+            logger.error(f"Failed to get conversation history for {session_id}: {e}")
+            return []
+    
     async def record_misconceptions(self, session_id: str, misconception_tags: List[str], 
                                     confidence: float = 1.0) -> bool:
-        """Record misconceptions with frequency tracking"""
+        """Record misconceptions with frequency tracking (single atomic write, no read)"""
         try:
-            # Get current misconceptions
-            session_doc = self.sessions.document(session_id).get()
-            if not session_doc.exists:
-                return False
-                
-            session_data = session_doc.to_dict()
-            misconceptions = session_data.get('misconceptions', {})
-            
-            now = datetime.now(timezone.utc).isoformat()
-            
-            # Update misconception data
-            for tag in misconception_tags:
-                if tag not in misconceptions:
-                    misconceptions[tag] = {
-                        'count': 0,
-                        'first_seen': now,
-                        'last_seen': now,
-                        'confidence_scores': []
-                    }
-                    
-                misconceptions[tag]['count'] += 1
-                misconceptions[tag]['last_seen'] = now
-                misconceptions[tag]['confidence_scores'].append(confidence)
-            
-            # Update session
-            self.sessions.document(session_id).update({
-                'misconceptions': misconceptions,
-                'updated_at': now
-            })
+            updates = {'updated_at': firestore.SERVER_TIMESTAMP,
+                       **_misconception_updates(misconception_tags, confidence)}
             
+            # update() fails on a missing session, matching the previous not-found behaviour
+            self.sessions.document(session_id).update(updates)
             return True
             
         except Exception as e:
             logger.error(f"Failed to record misconceptions for {session_id}: {e}")
             return False
     
-    async def finish_session(self, session_id: str, success: bool, final_accuracy: float) -> bool:
-        """Mark session as finished with final metrics"""
+    async def finish_session(self, session_id: str, learner_id: str, success: bool,
+                             final_accuracy: float, total_time_spent: int = 0) -> bool:
+        """Mark session as finished and release it from the learner in one atomic batch"""
         try:
-            now = datetime.now(timezone.utc).isoformat()
-            
             updates = {
                 'finished': True,
                 'success': success,
                 'final_accuracy': final_accuracy,
-                'completed_at': now,
-                'updated_at': now
+                'completed_at': firestore.SERVER_TIMESTAMP,
+                'updated_at': firestore.SERVER_TIMESTAMP
             }
             
-            self.sessions.document(session_id).update(updates)
-            
-            # Clear current session from learner
-            session_doc = self.sessions.document(session_id).get()
-            if session_doc.exists:
-                learner_id = session_doc.to_dict().get('learner_id')
-                if learner_id:
-                    await self.update_learner_progress(learner_id, {
-                        'current_session_id': None,
-                        'total_sessions': firestore.Increment(1)
-                    })
+            batch = self.db.batch()
+            if total_time_spent:
+                updates['total_time_spent'] = total_time_spent
+            
+            batch.update(self.sessions.document(session_id), updates)
+            # Clear current session from learner and roll the session into its running totals
+            batch.update(self.learners.document(learner_id), {
+                'current_session_id': None,
+                'total_sessions': firestore.Increment(1),
+                'total_time_spent': firestore.Increment(total_time_spent),
+                'updated_at': firestore.SERVER_TIMESTAMP
+            })
+            batch.commit()
             
             logger.info(f"Finished session: {session_id}")
             return True
@@ -404,10 +391,10 @@ class FirestoreRepository:
             collection_path = f"curriculum/{subject}/items"
             
             # Add metadata
-            now = datetime.now(timezone.utc).isoformat()
             item.update({
-                'created_at': now,
-                'updated_at': now,
+                'topic_lc': item.get('topic', subject).lower(),
+                'created_at': firestore.SERVER_TIMESTAMP,
+                'updated_at': firestore.SERVER_TIMESTAMP,
                 'usage_stats': {
                     'times_used': 0,
                     'success_rate': 0.0,
@@ -438,79 +425,60 @@ class FirestoreRepository:
     async def get_curriculum_by_subject(self, subject: str, limit: int = 100) -> List[Dict[str, Any]]:
         """Get all curriculum items for a subject, ordered by learning progression"""
         try:
-            # CRITICAL DEBUG: First let's inspect what's actually in the database
-            logger.info(f"🔍 CRITICAL DEBUG: Starting curriculum query for subject '{subject}'")
-            
-            # Check if collection exists and has documents
-            collection_ref = self.db.collection(COLLECTIONS["curriculum_questions"])
-            logger.info(f"🔍 CRITICAL DEBUG: Collection name: {COLLECTIONS['curriculum_questions']}")
-            
-            # Get all documents first to see what's actually there
-            all_docs = collection_ref.limit(5).get()
-            logger.info(f"🔍 CRITICAL DEBUG: Total documents in collection: {len(all_docs)}")
-            
-            if all_docs:
-                # Inspect first document structure
-                first_doc = all_docs[0]
-                first_data = first_doc.to_dict()
-                logger.info(f"🔍 CRITICAL DEBUG: First document ID: {first_doc.id}")
-                logger.info(f"🔍 CRITICAL DEBUG: First document keys: {list(first_data.keys()) if first_data else 'EMPTY'}")
-                if first_data:
-                    topic_value = first_data.get('topic', 'FIELD_NOT_FOUND')
-                    logger.info(f"🔍 CRITICAL DEBUG: First document topic field: '{topic_value}'")
-                    title_value = first_data.get('title', 'FIELD_NOT_FOUND')
-                    logger.info(f"🔍 CRITICAL DEBUG: First document title field: '{title_value}'")
-                    
-                    # Show ALL field values for debugging
-                    for key, value in first_data.items():
-                        if isinstance(value, str) and len(value) < 100:  # Only show short string values
-                            logger.info(f"🔍 CRITICAL DEBUG: Field '{key}': '{value}'")
-                        else:
-                            logger.info(f"🔍 CRITICAL DEBUG: Field '{key}': {type(value).__name__}")
-            else:
-                logger.error(f"🔍 CRITICAL DEBUG: Collection {COLLECTIONS['curriculum_questions']} is EMPTY!")
-                return []
-            
-            # Now try the original query with variations
-            subject_variations = [subject, subject.capitalize(), subject.upper(), subject.lower()]
-            logger.info(f"🔍 DEBUG: Trying subject variations for '{subject}': {subject_variations}")
+            # Single query against the normalized topic field (populated at write time),
+            # ordered server-side by the (topic_lc, learn_step) composite index
+            docs = (self.db.collection(COLLECTIONS["curriculum_questions"])
+                    .where("topic_lc", "==", subject.lower())
+                    .order_by("learn_step", direction=firestore.Query.ASCENDING)
+                    .limit(limit)
+                    .get())
             
             all_items = []
-            for topic_variant in subject_variations:
-                try:
-                    docs = (self.db.collection(COLLECTIONS["curriculum_questions"])
-                            .where("topic", "==", topic_variant)
-                            .limit(limit)
-                            .get())
-                    
-                    items = []
-                    for doc in docs:
-                        data = doc.to_dict()
-                        # Ensure the document has an 'id' field
-                        if 'id' not in data:
-                            data['id'] = doc.id
-                        items.append(data)
-                    
-                    logger.info(f"🔍 DEBUG: Topic variant '{topic_variant}' returned {len(items)} items")
-                    if items:
-                        all_items.extend(items)
-                        break  # Found items, stop trying variations
-                        
-                except Exception as e:
-                    logger.info(f"🔍 DEBUG: Topic variant '{topic_variant}' failed: {e}")
-                    continue
-            
-            # Sort by learn_step if we have items
-            if all_items:
-                all_items.sort(key=lambda x: x.get('learn_step', 0))
-            
-            logger.info(f"🔍 DEBUG: Final result for subject '{subject}': {len(all_items)} items")
+            for doc in docs:
+                data = doc.to_dict()
+                # Ensure the document has an 'id' field
+                if 'id' not in data:
+                    data['id'] = doc.id
+                all_items.append(data)
+            
             return all_items
             
         except Exception as e:
             logger.error(f"Failed to get curriculum for {subject}: {e}")
             return []
     
+    async def diagnose_curriculum(self, sample_size: int = 5) -> Dict[str, Any]:
+        """Inspect the curriculum collection's document structure (admin diagnostics only)"""
+        try:
+            docs = self.db.collection(COLLECTIONS["curriculum_questions"]).limit(sample_size).get()
+            if not docs:
+                return {'collection': COLLECTIONS["curriculum_questions"], 'sampled': 0, 'documents': []}
+            
+            documents = []
+            for doc in docs:
+                data = doc.to_dict() or {}
+                documents.append({
+                    'id': doc.id,
+                    'topic': data.get('topic'),
+                    'topic_lc': data.get('topic_lc'),
+                    'title': data.get('title'),
+                    # Show short string values inline, type names for everything else
+                    'fields': {
+                        key: value if isinstance(value, str) and len(value) < 100 else type(value).__name__
+                        for key, value in data.items()
+                    }
+                })
+            
+            return {
+                'collection': COLLECTIONS["curriculum_questions"],
+                'sampled': len(documents),
+                'documents': documents
+            }
+            
+        except Exception as e:
+            logger.error(f"Failed to diagnose curriculum collection: {e}")
+            return {'collection': COLLECTIONS["curriculum_questions"], 'error': str(e)}
+    
     # ============ ANALYTICS & REPORTING ============
     
     async def get_learner_analytics(self, learner_id: str, days: int = 30) -> Dict[str, Any]:
@@ -525,41 +493,47 @@ class FirestoreRepository:
             cutoff_date = datetime.now(timezone.utc).timestamp() - (days * 24 * 60 * 60)
             cutoff_iso = datetime.fromtimestamp(cutoff_date, tz=timezone.utc).isoformat()
             
-            recent_sessions = (self.sessions
-                               .where('learner_id', '==', learner_id)
-                               .where('started_at', '>=', cutoff_iso)
+            sessions_query = (self.sessions
+                              .where('learner_id', '==', learner_id)
+                              .where('started_at', '>=', cutoff_iso))
+            
+            # Summary totals cover the `days` window and are computed server-side
+            aggregates = (sessions_query
+                          .count(alias='session_count')
+                          .sum('total_time_spent', alias='total_time')
+                          .sum('final_accuracy', alias='accuracy_sum')
+                          .get())
+            totals = {result.alias: result.value for result in aggregates[0]}
+            session_count = int(totals.get('session_count') or 0)
+            total_time = int(totals.get('total_time') or 0)
+            # Unfinished sessions count as 0 accuracy, as when the average was summed client-side
+            average_accuracy = (totals.get('accuracy_sum') or 0.0) / max(session_count, 1)
+            
+            # Projected page of the newest sessions in the window: misconceptions for the summary,
+            # display fields for the first 10
+            recent_sessions = (sessions_query
+                               .select(['session_id', 'item_id', 'subject', 'finished', 'started_at',
+                                        'total_time_spent', 'final_accuracy', 'misconceptions'])
                                .order_by('started_at', direction=firestore.Query.DESCENDING)
                                .limit(50)
                                .get())
-            
-            # Compile analytics
             sessions_data = []
-            total_time = 0
-            total_accuracy = 0
             misconception_summary = {}
-            
             for doc in recent_sessions:
                 session_data = doc.to_dict()
-                sessions_data.append(session_data)
-                total_time += session_data.get('total_time_spent', 0)
-                total_accuracy += session_data.get('final_accuracy', 0)
-                
-                # Aggregate misconceptions
-                session_misconceptions = session_data.get('misconceptions', {})
-                for tag, data in session_misconceptions.items():
-                    if tag not in misconception_summary:
-                        misconception_summary[tag] = {'count': 0, 'sessions': 0}
-                    misconception_summary[tag]['count'] += data.get('count', 0)
-                    misconception_summary[tag]['sessions'] += 1
-            
-            session_count = len(sessions_data)
+                for tag, data in (session_data.pop('misconceptions', None) or {}).items():
+                    summary = misconception_summary.setdefault(tag, {'count': 0, 'sessions': 0})
+                    summary['count'] += data.get('count', 0)
+                    summary['sessions'] += 1
+                if len(sessions_data) < 10:
+                    sessions_data.append(session_data)
             
             return {
                 'learner_profile': learner.__dict__,
                 'summary': {
                     'total_sessions': session_count,
                     'total_time_minutes': total_time // 60,
-                    'average_accuracy': total_accuracy / max(session_count, 1),
+                    'average_accuracy': average_accuracy,
                     'mastery_scores': learner.mastery_scores,
                     'current_level': learner.level,
                     'total_xp': learner.xp
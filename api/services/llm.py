@@ -1,7 +1,255 @@
 from __future__ import annotations
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
 from typing import Optional, Dict, List, Any
 from core.config import settings
 
+logger = logging.getLogger(__name__)
+
+# SDK configuration and model objects are process-wide; initialize each once
+_INIT_LOCK = threading.Lock()
+_AISTUDIO_CONFIGURED = False
+_VERTEX_INITIALIZED = False
+_MODELS: Dict[tuple, Any] = {}
+_BUILD_LOCK = threading.Lock()
+
+# Caps concurrent async generations across all sessions in this process
+_LLM_SEMAPHORE = asyncio.Semaphore(settings.llm_max_concurrency)
+
+# Identical async generations already in flight; later callers await the first
+_INFLIGHT: Dict[str, "asyncio.Future"] = {}
+
+# Transient API errors worth retrying with backoff
+_RETRYABLE_ERRORS = ("ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded",
+                     "InternalServerError", "TooManyRequests")
+_MAX_ATTEMPTS = 3
+_BACKOFF_BASE_SECONDS = 0.5
+
+
+def _is_retryable(error: Exception) -> bool:
+    return type(error).__name__ in _RETRYABLE_ERRORS
+
+
+async def _generate_text_async(model, contents, generation_config: Dict[str, Any],
+                               response_text) -> Optional[str]:
+    """Run one async generation with retries, coalescing identical concurrent requests."""
+    key = hashlib.blake2b(
+        json.dumps([getattr(model, "model_name", ""), contents, generation_config],
+                   sort_keys=True, default=str).encode(),
+        digest_size=16,
+    ).hexdigest()
+    inflight = _INFLIGHT.get(key)
+    if inflight is not None:
+        return await asyncio.shield(inflight)
+
+    async def _call() -> Optional[str]:
+        for attempt in range(_MAX_ATTEMPTS):
+            try:
+                async with _LLM_SEMAPHORE:
+                    resp = await model.generate_content_async(contents, generation_config=generation_config)
+                return response_text(resp)
+            except Exception as e:
+                if attempt == _MAX_ATTEMPTS - 1 or not _is_retryable(e):
+                    raise
+                await asyncio.sleep(_BACKOFF_BASE_SECONDS * (2 ** attempt))
+
+    task = asyncio.ensure_future(_call())
+    _INFLIGHT[key] = task
+    task.add_done_callback(lambda _: _INFLIGHT.pop(key, None))
+    return await asyncio.shield(task)
+
+
+class JsonFieldStream:
+    """Incrementally decodes one string field out of a JSON object streamed in chunks.
+
+    feed() returns whatever part of the field's value became available with the
+    new chunk, so a reply can be relayed before the object is complete.
+    """
+
+    _ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+    def __init__(self, field: str):
+        self._key = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self.buffer = ""
+        self.done = False
+        self._pos: Optional[int] = None
+
+    def feed(self, text: str) -> str:
+        self.buffer += text
+        if self.done:
+            return ""
+        buf = self.buffer
+        if self._pos is None:
+            match = self._key.search(buf)
+            if not match:
+                return ""
+            self._pos = match.end()
+        out = []
+        i = self._pos
+        while i < len(buf):
+            c = buf[i]
+            if c == '"':
+                self.done = True
+                i += 1
+                break
+            if c != '\\':
+                out.append(c)
+                i += 1
+                continue
+            # Escape sequence; wait for more input if it is split across chunks
+            if i + 1 >= len(buf):
+                break
+            if buf[i + 1] != 'u':
+                out.append(self._ESCAPES.get(buf[i + 1], buf[i + 1]))
+                i += 2
+                continue
+            if i + 6 > len(buf):
+                break
+            code = int(buf[i + 2:i + 6], 16)
+            if 0xD800 <= code < 0xDC00:
+                # Surrogate pair (emoji): decode both halves together
+                if i + 12 > len(buf):
+                    break
+                low = int(buf[i + 8:i + 12], 16)
+                out.append(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+                i += 12
+                continue
+            out.append(chr(code))
+            i += 6
+        self._pos = i
+        return "".join(out)
+
+
+class ResponseCache:
+    """Thread-safe LRU cache with per-entry TTL for parsed LLM evaluations."""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 86400):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return copy.deepcopy(value)
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, copy.deepcopy(value))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+def _get_aistudio_model(model_name: str):
+    global _AISTUDIO_CONFIGURED
+    import google.generativeai as genai
+
+    with _INIT_LOCK:
+        if not _AISTUDIO_CONFIGURED:
+            genai.configure(api_key=settings.google_api_key)
+            _AISTUDIO_CONFIGURED = True
+        key = ("aistudio", model_name)
+        if key not in _MODELS:
+            _MODELS[key] = genai.GenerativeModel(model_name)
+        return _MODELS[key]
+
+
+def _get_vertex_model(model_name: str):
+    global _VERTEX_INITIALIZED
+    import vertexai
+    from vertexai.generative_models import GenerativeModel
+
+    with _INIT_LOCK:
+        if not _VERTEX_INITIALIZED:
+            vertexai.init(project=settings.vertex_project_id, location=settings.vertex_location)
+            _VERTEX_INITIALIZED = True
+        key = ("vertex", model_name)
+        if key not in _MODELS:
+            _MODELS[key] = GenerativeModel(model_name)
+        return _MODELS[key]
+
+
+# Static tutoring instructions. Kept byte-identical across calls so the prompt
+# prefix is stable for server-side prefix/context caching.
+_SYSTEM_PROMPT: str = (
+    "You are an expert Socratic math tutor for Primary 6 students (Singapore PSLE level). "
+    "Your role is to:\n"
+    "1. EVALUATE if the student's answer is mathematically correct\n"
+    "2. RESPOND with contextually appropriate tutoring guidance\n"
+    "3. IDENTIFY specific misconceptions and learning patterns\n\n"
+    "EVALUATION RULES:\n"
+    "- Check for mathematical equivalence (e.g., 'b+4', '4+b', 'b + 4' are all correct)\n"
+    "- Accept different valid forms of the same answer\n"
+    "- Be flexible with formatting and spacing\n\n"
+    "MISCONCEPTION DETECTION:\n"
+    "When the answer is incorrect, identify specific misconception tags from these common PSLE algebra errors:\n"
+    "- 'variable_confusion': mixing up variables or treating them as regular numbers\n"
+    "- 'operation_error': wrong operation (addition instead of multiplication, etc.)\n"
+    "- 'order_of_operations': incorrect precedence (PEMDAS/BODMAS errors)\n"
+    "- 'missing_variable': forgetting to include variables in expression\n"
+    "- 'coefficient_error': wrong coefficient or missing coefficient\n"
+    "- 'sign_error': positive/negative sign mistakes\n"
+    "- 'distributive_error': incorrect distribution over parentheses\n"
+    "- 'combine_like_terms': incorrectly combining or not combining like terms\n"
+    "- 'substitution_error': wrong substitution of values\n"
+    "- 'word_problem_translation': misinterpreting the word problem\n\n"
+    "CONTEXTUAL TUTORING:\n"
+    "- Use conversation history to build on previous exchanges\n"
+    "- Reference past mistakes or successes when relevant\n"
+    "- Adapt your approach based on observed misconception patterns\n"
+    "- Don't repeat identical guidance - vary your teaching approach\n\n"
+    "TUTORING STYLE:\n"
+    "- Use encouraging, patient language\n"
+    "- Ask Socratic questions to guide thinking\n"
+    "- Give hints that build understanding, don't give direct answers\n"
+    "- Keep responses short and focused (1-2 sentences)\n"
+    "- Address misconceptions without explicitly stating them\n\n"
+    "RESPONSE FORMAT:\n"
+    "Always respond with exactly this JSON format:\n"
+    '{"is_correct": true/false, "response": "your tutoring message", "should_advance": true/false, "learning_insight": "optional insight", "misconception_tags": ["tag1", "tag2"], "confidence_level": 0.8}\n\n'
+    "- is_correct: true if answer is mathematically correct, false otherwise\n"
+    "- response: your contextual tutoring message to the student\n"
+    "- should_advance: true if student should move to next step, false to retry current step\n"
+    "- learning_insight: observation about student's learning pattern\n"
+    "- misconception_tags: array of identified misconception tags (empty if correct)\n"
+    "- confidence_level: your confidence in the evaluation (0.0 to 1.0)"
+)
+
+# Per-request user message; optional sections are empty strings so the shape is fixed
+_USER_TMPL: str = (
+    "PROBLEM: {problem}\n\n"
+    "CURRENT STEP: {step}\n\n"
+    "STUDENT ANSWER: '{answer}'\n\n"
+    "ATTEMPT NUMBER: {attempt}\n"
+    "{expected}"
+    "{context}"
+    "{insights}"
+    "{hints}\n"
+    "Using the conversation context and learning insights, evaluate the student's answer and provide "
+    "a contextually appropriate tutoring response in JSON format."
+)
+
 
 class LLMClient:
     def evaluate_and_respond(self, *, problem_text: str, step_prompt: str, user_response: str, 
@@ -10,7 +258,7 @@ class LLMClient:
                            learning_insights: List[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Evaluate student response and generate tutoring response.
-        
+
         Returns:
             {
                 "is_correct": bool,
@@ -23,37 +271,57 @@ class LLMClient:
         """
         raise NotImplementedError
 
+    async def evaluate_and_respond_async(self, **kwargs) -> Dict[str, Any]:
+        """Async evaluate_and_respond; clients without a native async API run the sync call in a thread."""
+        return await asyncio.to_thread(lambda: self.evaluate_and_respond(**kwargs))
+
 
 class GeminiLLM(LLMClient):
+    # Shape of the evaluation reply, enforced by the API's structured-output mode
+    _EVALUATION_SCHEMA = {
+        "type": "OBJECT",
+        "properties": {
+            "is_correct": {"type": "BOOLEAN"},
+            "response": {"type": "STRING"},
+            "should_advance": {"type": "BOOLEAN"},
+            "learning_insight": {"type": "STRING"},
+            "misconception_tags": {"type": "ARRAY", "items": {"type": "STRING"}},
+            "confidence_level": {"type": "NUMBER"},
+        },
+        "required": ["is_correct", "response", "should_advance"],
+    }
+
+    # Bound decode length: replies are a short JSON object
+    _GENERATION_CONFIG = {
+        "max_output_tokens": 1024,
+        "temperature": 0.6,
+        "candidate_count": 1,
+        "response_mime_type": "application/json",
+        "response_schema": _EVALUATION_SCHEMA,
+    }
+
     def __init__(self, model_name: Optional[str] = None):
         self.model_name = model_name or "gemini-2.5-flash"
         
         # Try Google AI Studio API first if API key is available
         if settings.google_api_key:
             try:
-                import google.generativeai as genai
-                
-                genai.configure(api_key=settings.google_api_key)
-                self._model = genai.GenerativeModel(self.model_name)
+                self._model = _get_aistudio_model(self.model_name)
                 self._use_vertex = False
-                print(f"Initialized Gemini with Google AI Studio API")  # Debug logging
+                logger.debug("Initialized Gemini with Google AI Studio API")
                 return
             except Exception as e:
-                print(f"Google AI Studio initialization failed: {e}")  # Debug logging
+                logger.warning("Google AI Studio initialization failed: %s", e)
         
         # Fallback to Vertex AI if project ID is configured
         if settings.vertex_project_id:
             try:
-                import vertexai
-                from vertexai.generative_models import GenerativeModel
-                
-                vertexai.init(project=settings.vertex_project_id, location=settings.vertex_location)
-                self._model = GenerativeModel(self.model_name)
+                self._model = _get_vertex_model(self.model_name)
                 self._use_vertex = True
-                print(f"Initialized Gemini with Vertex AI")  # Debug logging
+                logger.debug("Initialized Gemini with Vertex AI")
                 return
             except Exception as e:
-                print(f"Vertex AI initialization failed: {e}")  # Debug logging
+                logger.warning("Vertex AI initialization failed: %s", e)
         
         raise ValueError("Failed to initialize Gemini: Need either GOOGLE_API_KEY or valid VERTEX_PROJECT_ID")
 
@@ -62,191 +330,200 @@ class GeminiLLM(LLMClient):
                            expected_answers: List[str], conversation_history: List[Dict[str, Any]] = None,
                            learning_insights: List[Dict[str, Any]] = None) -> Dict[str, Any]:
         try:
-            # Build conversation history context
-            context_text = ""
-            if conversation_history:
-                context_text = "\nCONVERSATION HISTORY (recent exchanges):\n"
-                for entry in conversation_history[-5:]:  # Last 5 exchanges
-                    role = entry.get("role", "").title()
-                    message = entry.get("message", "")
-                    context_text += f"{role}: {message}\n"
-            
-            # Build learning insights context
-            insights_text = ""
-            if learning_insights:
-                insights_text = "\nLEARNING INSIGHTS (student patterns observed):\n"
-                for insight in learning_insights[-3:]:  # Last 3 insights
-                    insights_text += f"- {insight.get('insight', '')}\n"
-
-            # Build hint guidelines text
-            hints_text = ""
-            if hints_guidelines:
-                hints_text = "\nHint Guidelines (for your reference only - do not copy these directly):\n"
-                for hint in hints_guidelines:
-                    level = hint.get("level", "")
-                    text = hint.get("text", "")
-                    hints_text += f"- Level {level}: {text}\n"
-
-            # Build expected answers text
-            expected_text = ""
-            if expected_answers:
-                expected_text = f"\nExpected correct answers: {', '.join(expected_answers)}"
-
-            system_prompt = (
-                "You are an expert Socratic math tutor for Primary 6 students (Singapore PSLE level). "
-                "Your role is to:\n"
-                "1. EVALUATE if the student's answer is mathematically correct\n"
-                "2. RESPOND with contextually appropriate tutoring guidance\n"
-                "3. IDENTIFY specific misconceptions and learning patterns\n\n"
-                "EVALUATION RULES:\n"
-                "- Check for mathematical equivalence (e.g., 'b+4', '4+b', 'b + 4' are all correct)\n"
-                "- Accept different valid forms of the same answer\n"
-                "- Be flexible with formatting and spacing\n\n"
-                "MISCONCEPTION DETECTION:\n"
-                "When the answer is incorrect, identify specific misconception tags from these common PSLE algebra errors:\n"
-                "- 'variable_confusion': mixing up variables or treating them as regular numbers\n"
-                "- 'operation_error': wrong operation (addition instead of multiplication, etc.)\n"
-                "- 'order_of_operations': incorrect precedence (PEMDAS/BODMAS errors)\n"
-                "- 'missing_variable': forgetting to include variables in expression\n"
-                "- 'coefficient_error': wrong coefficient or missing coefficient\n"
-                "- 'sign_error': positive/negative sign mistakes\n"
-                "- 'distributive_error': incorrect distribution over parentheses\n"
-                "- 'combine_like_terms': incorrectly combining or not combining like terms\n"
-                "- 'substitution_error': wrong substitution of values\n"
-                "- 'word_problem_translation': misinterpreting the word problem\n\n"
-                "CONTEXTUAL TUTORING:\n"
-                "- Use conversation history to build on previous exchanges\n"
-                "- Reference past mistakes or successes when relevant\n"
-                "- Adapt your approach based on observed misconception patterns\n"
-                "- Don't repeat identical guidance - vary your teaching approach\n\n"
-                "TUTORING STYLE:\n"
-                "- Use encouraging, patient language\n"
-                "- Ask Socratic questions to guide thinking\n"
-                "- Give hints that build understanding, don't give direct answers\n"
-                "- Keep responses short and focused (1-2 sentences)\n"
-                "- Address misconceptions without explicitly stating them\n\n"
-                "RESPONSE FORMAT:\n"
-                "Always respond with exactly this JSON format:\n"
-                '{"is_correct": true/false, "response": "your tutoring message", "should_advance": true/false, "learning_insight": "optional insight", "misconception_tags": ["tag1", "tag2"], "confidence_level": 0.8}\n\n'
-                "- is_correct: true if answer is mathematically correct, false otherwise\n"
-                "- response: your contextual tutoring message to the student\n"
-                "- should_advance: true if student should move to next step, false to retry current step\n"
-                "- learning_insight: observation about student's learning pattern\n"
-                "- misconception_tags: array of identified misconception tags (empty if correct)\n"
-                "- confidence_level: your confidence in the evaluation (0.0 to 1.0)"
+            user_message = self._build_user_message(
+                problem_text=problem_text, step_prompt=step_prompt, user_response=user_response,
+                attempts=attempts, hints_guidelines=hints_guidelines, expected_answers=expected_answers,
+                conversation_history=conversation_history, learning_insights=learning_insights,
             )
+            resp = self._model.generate_content([_SYSTEM_PROMPT, user_message],
+                                                generation_config=self._GENERATION_CONFIG)
+            return self._parse_evaluation(self._response_text(resp)) or self._fallback_evaluation()
+        except Exception as e:
+            return self._evaluation_error(e)
 
-            user_message = (
-                f"PROBLEM: {problem_text}\n\n"
-                f"CURRENT STEP: {step_prompt}\n\n"
-                f"STUDENT ANSWER: '{user_response}'\n\n"
-                f"ATTEMPT NUMBER: {attempts + 1}\n"
-                f"{expected_text}"
-                f"{context_text}"
-                f"{insights_text}"
-                f"{hints_text}\n"
-                "Using the conversation context and learning insights, evaluate the student's answer and provide "
-                "a contextually appropriate tutoring response in JSON format."
+    async def evaluate_and_respond_async(self, *, problem_text: str, step_prompt: str, user_response: str,
+                                         attempts: int, hints_guidelines: List[Dict[str, Any]],
+                                         expected_answers: List[str],
+                                         conversation_history: List[Dict[str, Any]] = None,
+                                         learning_insights: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Async variant of evaluate_and_respond; in-flight calls are bounded by the LLM semaphore."""
+        try:
+            user_message = self._build_user_message(
+                problem_text=problem_text, step_prompt=step_prompt, user_response=user_response,
+                attempts=attempts, hints_guidelines=hints_guidelines, expected_answers=expected_answers,
+                conversation_history=conversation_history, learning_insights=learning_insights,
             )
-
-            if self._use_vertex:
-                resp = self._model.generate_content([system_prompt, user_message])
-                text = getattr(resp, "text", None) or (resp.candidates[0].content.parts[0].text if resp.candidates else None)
-            else:
-                # Google AI Studio API
-                resp = self._model.generate_content([system_prompt, user_message])
-                text = resp.text if hasattr(resp, 'text') else None
-            
-            if text:
-                print(f"Gemini raw response: {text}")  # Debug logging
-                import json
-                # Try to extract JSON from response
-                text = text.strip()
-                if text.startswith("```json"):
-                    text = text[7:]
-                if text.endswith("```"):
-                    text = text[:-3]
-                text = text.strip()
-                
-                print(f"Processed text for JSON: {text}")  # Debug logging
-                
-                try:
-                    result = json.loads(text)
-                    print(f"Parsed JSON result: {result}")  # Debug logging
-                    # Validate required fields
-                    required_fields = ["is_correct", "response", "should_advance"]
-                    if all(key in result for key in required_fields):
-                        # Ensure optional fields are present
-                        if "learning_insight" not in result:
-                            result["learning_insight"] = ""
-                        if "misconception_tags" not in result:
-                            result["misconception_tags"] = []
-                        if "confidence_level" not in result:
-                            result["confidence_level"] = 1.0
-                        return result
-                    else:
-                        print(f"Missing required fields in result: {result}")  # Debug logging
-                except json.JSONDecodeError as e:
-                    print(f"JSON decode error: {e}")  # Debug logging
-            else:
-                print("No text received from Gemini")  # Debug logging
-            
-            # Fallback response
-            return {
-                "is_correct": False,
-                "response": "Let me help you think through this step by step. What operation do you think we need here?",
-                "should_advance": False
-            }
+            text = await _generate_text_async(self._model, [_SYSTEM_PROMPT, user_message],
+                                              self._GENERATION_CONFIG, self._response_text)
+            return self._parse_evaluation(text) or self._fallback_evaluation()
         except Exception as e:
-            # AI failure - no fallback, transparent error
-            print(f"LLM Error: {e}")  # Debug logging
-            import traceback
-            traceback.print_exc()  # Debug logging
-            return {
-                "is_correct": None,
-                "response": "Oops! I need a moment to think about your answer. Please try submitting it again!",
-                "should_advance": False,
-                "error": f"AI_EVALUATION_FAILED: {str(e)}"
-            }
+            return self._evaluation_error(e)
+
+    def _build_user_message(self, *, problem_text: str, step_prompt: str, user_response: str,
+                            attempts: int, hints_guidelines: List[Dict[str, Any]],
+                            expected_answers: List[str], conversation_history: List[Dict[str, Any]] = None,
+                            learning_insights: List[Dict[str, Any]] = None) -> str:
+        # Build conversation history context
+        context_text = ""
+        if conversation_history:
+            parts = ["\nCONVERSATION HISTORY (recent exchanges):\n"]
+            parts.extend(f"{entry.get('role', '').title()}: {entry.get('message', '')}\n"
+                         for entry in conversation_history[-5:])  # Last 5 exchanges
+            context_text = "".join(parts)
+        
+        # Build learning insights context
+        insights_text = ""
+        if learning_insights:
+            parts = ["\nLEARNING INSIGHTS (student patterns observed):\n"]
+            parts.extend(f"- {insight.get('insight', '')}\n"
+                         for insight in learning_insights[-3:])  # Last 3 insights
+            insights_text = "".join(parts)
+
+        # Build hint guidelines text
+        hints_text = ""
+        if hints_guidelines:
+            parts = ["\nHint Guidelines (for your reference only - do not copy these directly):\n"]
+            parts.extend(f"- Level {hint.get('level', '')}: {hint.get('text', '')}\n"
+                         for hint in hints_guidelines)
+            hints_text = "".join(parts)
+
+        # Build expected answers text
+        expected_text = ""
+        if expected_answers:
+            expected_text = f"\nExpected correct answers: {', '.join(expected_answers)}"
+
+        return _USER_TMPL.format(
+            problem=problem_text, step=step_prompt, answer=user_response, attempt=attempts + 1,
+            expected=expected_text, context=context_text, insights=insights_text, hints=hints_text,
+        )
 
-    def generate(self, prompt: str, max_tokens: int = 500) -> str:
+    def _response_text(self, resp) -> Optional[str]:
+        if self._use_vertex:
+            return getattr(resp, "text", None) or (resp.candidates[0].content.parts[0].text if resp.candidates else None)
+        # Google AI Studio API
+        return resp.text if hasattr(resp, 'text') else None
+
+    def _parse_evaluation(self, text: Optional[str]) -> Optional[Dict[str, Any]]:
+        if text:
+            logger.debug("Gemini raw response: %s", text)
+            # Structured-output mode returns bare JSON, no code fences
+            try:
+                result = json.loads(text)
+                logger.debug("Parsed JSON result: %s", result)
+                # Validate required fields
+                required_fields = ["is_correct", "response", "should_advance"]
+                if all(key in result for key in required_fields):
+                    # Ensure optional fields are present
+                    if "learning_insight" not in result:
+                        result["learning_insight"] = ""
+                    if "misconception_tags" not in result:
+                        result["misconception_tags"] = []
+                    if "confidence_level" not in result:
+                        result["confidence_level"] = 1.0
+                    return result
+                else:
+                    logger.debug("Missing required fields in result: %s", result)
+            except json.JSONDecodeError as e:
+                logger.debug("JSON decode error: %s", e)
+        else:
+            logger.debug("No text received from Gemini")
+        return None
+
+    def _fallback_evaluation(self) -> Dict[str, Any]:
+        return {
+            "is_correct": False,
+            "response": "Let me help you think through this step by step. What operation do you think we need here?",
+            "should_advance": False
+        }
+
+    def _evaluation_error(self, e: Exception) -> Dict[str, Any]:
+        # AI failure - no fallback, transparent error
+        logger.debug("LLM evaluation failed", exc_info=True)
+        return {
+            "is_correct": None,
+            "response": "Oops! I need a moment to think about your answer. Please try submitting it again!",
+            "should_advance": False,
+            "error": f"AI_EVALUATION_FAILED: {str(e)}"
+        }
+
+    @staticmethod
+    def _generation_config(max_tokens: int, response_schema: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        config: Dict[str, Any] = {"max_output_tokens": max_tokens}
+        if response_schema is not None:
+            # Structured-output mode: the reply is bare JSON matching the schema
+            config.update(response_mime_type="application/json", response_schema=response_schema)
+        return config
+
+    def generate(self, prompt: str, max_tokens: int = 500,
+                 response_schema: Optional[Dict[str, Any]] = None) -> str:
         """Generate text response from AI model - for compatibility with orchestrator."""
+        generation_config = self._generation_config(max_tokens, response_schema)
         try:
             if self._use_vertex:
-                resp = self._model.generate_content(prompt)
+                resp = self._model.generate_content(prompt, generation_config=generation_config)
                 return getattr(resp, "text", None) or (resp.candidates[0].content.parts[0].text if resp.candidates else "")
             else:
                 # Google AI Studio API
-                resp = self._model.generate_content(prompt)
+                resp = self._model.generate_content(prompt, generation_config=generation_config)
                 return resp.text if hasattr(resp, 'text') else ""
         except Exception as e:
             raise Exception(f"AI generation failed: {str(e)}")
 
+    async def generate_async(self, prompt: str, max_tokens: int = 500,
+                             response_schema: Optional[Dict[str, Any]] = None) -> str:
+        """Async variant of generate(); in-flight calls are bounded by the LLM semaphore."""
+        try:
+            text = await _generate_text_async(self._model, prompt,
+                                              self._generation_config(max_tokens, response_schema),
+                                              self._response_text)
+            return text or ""
+        except Exception as e:
+            raise Exception(f"AI generation failed: {str(e)}")
+
+    async def generate_stream(self, prompt: str, max_tokens: int = 500,
+                              response_schema: Optional[Dict[str, Any]] = None):
+        """Yield generated text chunks as they arrive, for relaying over SSE."""
+        try:
+            async with _LLM_SEMAPHORE:
+                resp = await self._model.generate_content_async(
+                    prompt, generation_config=self._generation_config(max_tokens, response_schema), stream=True)
+                async for chunk in resp:
+                    try:
+                        text = chunk.text
+                    except (ValueError, AttributeError):
+                        # Chunks without text parts (e.g. finish metadata)
+                        continue
+                    if text:
+                        yield text
+        except Exception as e:
+            raise Exception(f"AI generation failed: {str(e)}")
+
     def parse_json_response(self, response_text: str, fallback_dict: dict) -> dict:
         """Parse JSON response from AI model - for compatibility with orchestrator."""
         try:
-            import json
-            # Clean the response
-            text = response_text.strip()
-            if text.startswith("```json"):
-                text = text[7:]
-            if text.endswith("```"):
-                text = text[:-3]
-            text = text.strip()
-            
-            result = json.loads(text)
-            return result
+            # Replies are requested in structured-output mode, so they carry no code fences
+            return json.loads(response_text)
         except Exception as e:
             # AI failure - no fallback to hardcoded values
             raise Exception(f"AI JSON parsing failed: {str(e)}")
 
 
 def build_llm() -> Optional[LLMClient]:
+    """Process-wide LLM client; built on first use, shared by every caller after."""
+    # The lock makes concurrent first calls wait for one construction
+    # instead of each building (and configuring the SDK for) its own client
+    with _BUILD_LOCK:
+        return _build_llm()
+
+
+@lru_cache(maxsize=1)
+def _build_llm() -> Optional[LLMClient]:
     if not settings.enable_llm:
         return None
     prov = (settings.llm_provider or "").lower()
     if prov in ("vertex", "gemini", "google"):
-        return GeminiLLM(model_name=settings.llm_model or "gemini-2.5-flash-lite")
+        model_name = settings.llm_model or "gemini-2.5-flash-lite"
+        return GeminiLLM(model_name=model_name)
     # Other providers can be added here
     return None
 
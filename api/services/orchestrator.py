@@ -1,22 +1,303 @@
 from __future__ import annotations
+import ast
+import cmath
+import hashlib
+import logging
+import random
+import re
+import string
+from fractions import Fraction
+from functools import lru_cache
 from typing import Tuple, Optional, Dict, Any, List
-from sympy import sympify, Eq
 
 from core.config import settings
-from services.llm import build_llm, LLMClient
+from services.llm import build_llm, LLMClient, JsonFieldStream, ResponseCache
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=4096)
+def _parsed(expr: str):
+    # Answer keys are a small, repeating set; parse each expression once.
+    # sympy is imported lazily so only the CAS fallback pays for it.
+    from sympy import sympify
+    return sympify(expr)
+
+
+class _UnsupportedExpression(Exception):
+    pass
+
+
+# Learner input is untrusted: anything past these limits is left to the tutor model
+_MAX_EXPRESSION_LENGTH = 200
+_MAX_EXPRESSION_DEPTH = 32
+_MAX_POLY_TERMS = 256
+_MAX_POLY_DEGREE = 24
+
+
+def _check_poly(poly: dict) -> dict:
+    if len(poly) > _MAX_POLY_TERMS:
+        raise _UnsupportedExpression("too many terms")
+    if any(sum(power for _, power in mono) > _MAX_POLY_DEGREE for mono in poly):
+        raise _UnsupportedExpression("degree too high")
+    return poly
+
+
+def _tree_depth(tree) -> int:
+    """Nesting depth of an AST, computed without recursion."""
+    deepest, stack = 0, [(tree, 1)]
+    while stack:
+        node, depth = stack.pop()
+        deepest = max(deepest, depth)
+        stack.extend((child, depth + 1) for child in ast.iter_child_nodes(node))
+    return deepest
+
+
+# Polynomials as {monomial: coefficient}; a monomial is a sorted tuple of (variable, power)
+def _poly_add(a: dict, b: dict, sign: int = 1) -> dict:
+    out = dict(a)
+    for mono, coef in b.items():
+        out[mono] = out.get(mono, 0) + sign * coef
+    return {mono: coef for mono, coef in out.items() if coef != 0}
+
+
+def _poly_mul(a: dict, b: dict) -> dict:
+    out: Dict[tuple, Fraction] = {}
+    for mono_a, coef_a in a.items():
+        for mono_b, coef_b in b.items():
+            powers = dict(mono_a)
+            for var, power in mono_b:
+                powers[var] = powers.get(var, 0) + power
+            mono = tuple(sorted(powers.items()))
+            out[mono] = out.get(mono, 0) + coef_a * coef_b
+    return _check_poly({mono: coef for mono, coef in out.items() if coef != 0})
+
+
+def _poly(node) -> dict:
+    if isinstance(node, ast.Expression):
+        return _poly(node.body)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        value = Fraction(str(node.value))
+        return {(): value} if value else {}
+    if isinstance(node, ast.Name):
+        return {((node.id, 1),): Fraction(1)}
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        operand = _poly(node.operand)
+        return operand if isinstance(node.op, ast.UAdd) else {m: -c for m, c in operand.items()}
+    if isinstance(node, ast.BinOp):
+        left, right = _poly(node.left), _poly(node.right)
+        if isinstance(node.op, ast.Add):
+            return _poly_add(left, right)
+        if isinstance(node.op, ast.Sub):
+            return _poly_add(left, right, -1)
+        if isinstance(node.op, ast.Mult):
+            return _poly_mul(left, right)
+        if isinstance(node.op, ast.Div) and set(right) == {()}:
+            # Division by a nonzero constant only
+            return {mono: coef / right[()] for mono, coef in left.items()}
+        if isinstance(node.op, ast.Pow) and set(right) <= {()}:
+            power = right.get((), 0)
+            if power.denominator == 1 and 0 <= power <= 12:
+                # Reject before expanding: the degree bound is known from the base alone
+                degree = max((sum(p for _, p in mono) for mono in left), default=0)
+                if degree * power > _MAX_POLY_DEGREE:
+                    raise _UnsupportedExpression("degree too high")
+                result = {(): Fraction(1)}
+                for _ in range(int(power)):
+                    result = _poly_mul(result, left)
+                return result
+    raise _UnsupportedExpression(ast.dump(node))
+
+
+@lru_cache(maxsize=4096)
+def canonical_form(expr: str) -> Optional[str]:
+    """Canonical sum-of-products string for a simple polynomial expression, or None.
+
+    "b+4", "4 + b" and "2*(b+2)-b" all map to "4+1*b". Returns None for anything
+    outside +, -, *, constant division and small integer powers, and for input too
+    long, too deeply nested or expanding to too many terms to check cheaply.
+    """
+    expr = expr.strip()
+    if len(expr) > _MAX_EXPRESSION_LENGTH:
+        return None
+    try:
+        tree = ast.parse(expr.replace("^", "**"), mode="eval")
+        if _tree_depth(tree) > _MAX_EXPRESSION_DEPTH:
+            return None
+        poly = _poly(tree)
+    except (SyntaxError, ValueError, ZeroDivisionError, RecursionError, MemoryError, _UnsupportedExpression):
+        return None
+    if not poly:
+        return "0"
+    terms = []
+    for mono in sorted(poly, key=lambda m: (sum(p for _, p in m), m)):
+        factors = "*".join(var if power == 1 else f"{var}^{power}" for var, power in mono)
+        terms.append(f"{poly[mono]}*{factors}" if factors else str(poly[mono]))
+    return "+".join(terms)
+
+
+# One translate pass both lowercases and turns all whitespace (incl. the no-break space keyboards
+# insert) into plain spaces
+_NORM_TABLE = str.maketrans(
+    {**{c: " " for c in string.whitespace + "\u00a0"}, **{c: c.lower() for c in string.ascii_uppercase}}
+)
+
+# Spacing around operators is cosmetic ("b + 4"), but a space between two letters or digits carries
+# meaning ("1 1/2" is not "11/2", "3 4" is not "34"), so only the former is dropped
+_SPACE_RUN = re.compile(r" {2,}")
+_COSMETIC_SPACE = re.compile(r" (?![0-9a-z])|(?<![0-9a-z]) ")
+
+
+def _normalize_answer(answer: Any) -> str:
+    return _normalize_text(answer if isinstance(answer, str) else str(answer))
+
+
+@lru_cache(maxsize=4096)
+def _normalize_text(text: str) -> str:
+    # Accepted answers repeat on every submission; cache their normalized form
+    spaced = _SPACE_RUN.sub(" ", text.translate(_NORM_TABLE)).strip()
+    return _COSMETIC_SPACE.sub("", spaced)
+
+
+# Replies that are clearly not an attempt at the answer
+_NON_ATTEMPTS = {"idk", "dunno", "i dont know", "i don't know", "no idea", "not sure", "?", "??", "???"}
+
+# Characters that can never change a mathematical answer's meaning (stray quotes and backticks).
+# Anything else, including <, >, :, %, ! and spaces between digits, may be significant.
+_COSMETIC_CHARS = str.maketrans("", "", "'\"`\u2018\u2019\u201c\u201d")
+
+
+def _edit_distance(a: str, b: str) -> int:
+    """Damerau-Levenshtein (optimal string alignment) distance; inputs are short answers."""
+    previous2, previous = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i] + [0] * len(b)
+        for j, cb in enumerate(b, start=1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if previous2 is not None and i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[len(b)]
+
+
+def _triage(user_response: str, accepted: List[Any]) -> str:
+    """Classify an answer as "correct", "wrong" or "ambiguous" without an LLM.
+
+    Only "ambiguous" answers need the tutor model.
+    """
+    normalized = _normalize_answer(user_response)
+    # str.isalnum also covers "½", "π", "²" and CJK numerals, which must reach the tutor model
+    if not any(c.isalnum() for c in normalized) or normalized in _NON_ATTEMPTS:
+        return "wrong"
+
+    candidates = [_normalize_answer(a) for a in accepted]
+    if normalized in candidates:
+        return "correct"
+    # One-character slips that only touch allow-listed cosmetic characters ("'b+4", "b+4`");
+    # any other difference is left to the tutor model
+    stripped = normalized.translate(_COSMETIC_CHARS)
+    for candidate in candidates:
+        if _edit_distance(normalized, candidate) <= 1 and stripped == candidate.translate(_COSMETIC_CHARS):
+            return "correct"
+
+    # Rearranged algebra ("4+b" for "b+4"). Pure arithmetic is excluded so
+    # echoing "2+3" back doesn't count as answering "5".
+    user_form = canonical_form(user_response.lower())
+    if user_form and re.search(r"[a-z]", user_form):
+        if any(canonical_form(str(a).lower()) == user_form for a in accepted):
+            return "correct"
+    return "ambiguous"
+
+
+def _pick_hint(hints: List[Any], attempts_so_far: int) -> Optional[str]:
+    """Static hint for this attempt, escalating one level per attempt and capping at the last."""
+    if not hints:
+        return None
+    hint = hints[min(attempts_so_far, len(hints)) - 1] if attempts_so_far > 0 else hints[0]
+    if isinstance(hint, dict):
+        return hint.get("text") or hint.get("hint_text")
+    return str(hint) if hint else None
+
+
+def _is_repeat_submission(user_response: str, attempts_so_far: int, session: Optional[dict]) -> bool:
+    """True when the student resubmits the answer they gave on their previous attempt."""
+    if attempts_so_far <= 0 or not session:
+        return False
+    for entry in reversed(session.get("conversation_history") or []):
+        if entry.get("role") != "student":
+            continue
+        # The current submission may already be in the history; skip past it
+        if (entry.get("metadata") or {}).get("attempt") == attempts_so_far + 1:
+            continue
+        return _normalize_answer(entry.get("message", "")) == _normalize_answer(user_response)
+    return False
+
+
+_SAMPLE_POINTS = 5
+
+
+def _numerically_differ(a, b) -> bool:
+    """True if a and b disagree at some random rational point (cheap disproof of equivalence)."""
+    from sympy import Rational
+    try:
+        difference = a - b
+        symbols = sorted(difference.free_symbols, key=str)
+    except (TypeError, AttributeError):
+        # Not arithmetic expressions (e.g. equations); leave it to Eq
+        return False
+    rng = random.Random(42)
+    for _ in range(_SAMPLE_POINTS):
+        point = {symbol: Rational(rng.randint(1, 97), rng.randint(1, 13)) for symbol in symbols}
+        try:
+            value = complex(difference.subs(point).evalf())
+        except (TypeError, ValueError):
+            continue
+        if not cmath.isfinite(value):
+            # Sampled a pole; try another point
+            continue
+        if abs(value) > 1e-9:
+            return True
+    return False
 
 
 def cas_equivalent(user: str, target: str) -> bool:
     """Fallback CAS check for complex algebraic expressions."""
     try:
-        return bool(Eq(sympify(user), sympify(target)))
+        from sympy import Eq
+        a, b = _parsed(user), _parsed(target)
+        if _numerically_differ(a, b):
+            return False
+        return bool(Eq(a, b))
     except Exception:
         return False
 
 
+# Parsed tutor replies keyed by prompt, shared by every orchestrator unless one is injected
+_EVALUATION_CACHE = ResponseCache(maxsize=settings.llm_cache_size, ttl=settings.llm_cache_ttl_seconds)
+
+
+# Shape of the simplified tutor reply, enforced by the API's structured-output mode
+_SIMPLIFIED_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "is_correct": {"type": "BOOLEAN"},
+        "feedback": {"type": "STRING"},
+        "should_advance": {"type": "BOOLEAN"},
+    },
+    "required": ["is_correct", "feedback", "should_advance"],
+}
+
+
+def _prompt_cache_key(prompt: str) -> str:
+    # The simplified prompt is built from the item and the raw answer only, so
+    # identical prompts get interchangeable verdicts
+    return hashlib.blake2b(prompt.encode(), digest_size=16).hexdigest()
+
+
 class SimpleOrchestrator:
-    def __init__(self, llm: LLMClient | None = None):
+    def __init__(self, llm: LLMClient | None = None, cache: ResponseCache | None = None):
         self._llm = llm or build_llm()
+        self._cache = cache if cache is not None else _EVALUATION_CACHE
 
     def evaluate_simplified(self, user_response: str, item: dict, attempts_so_far: int, 
                           session: dict = None) -> Tuple[Optional[bool], Optional[str], Optional[str], dict]:
@@ -24,9 +305,115 @@ class SimpleOrchestrator:
         
         Returns: (correctness, next_prompt, hint, evaluation_data)
         """
+        trivial = self._trivial_result(user_response, item) or self._repeat_result(
+            user_response, (item.get("ai_guidance") or {}).get("hints", []), attempts_so_far, session, False)
+        if trivial:
+            return trivial
+
+        if not self._llm:
+            return None, None, "I need to think about this. Let's try again.", {}
+
+        system_prompt = self._simplified_prompt(user_response, item, session)
+        cache_key = _prompt_cache_key(system_prompt)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return self._simplified_outcome(cached)
+        try:
+            response = self._llm.generate(system_prompt, max_tokens=500,
+                                          response_schema=_SIMPLIFIED_SCHEMA)
+            return self._simplified_result(response, cache_key)
+        except Exception as e:
+            return self._simplified_error(e)
+
+    async def evaluate_simplified_async(self, user_response: str, item: dict, attempts_so_far: int,
+                                        session: dict = None) -> Tuple[Optional[bool], Optional[str], Optional[str], dict]:
+        """Async evaluate_simplified: awaits the LLM so one event loop can serve many sessions."""
+        trivial = self._trivial_result(user_response, item) or self._repeat_result(
+            user_response, (item.get("ai_guidance") or {}).get("hints", []), attempts_so_far, session, False)
+        if trivial:
+            return trivial
+
         if not self._llm:
             return None, None, "I need to think about this. Let's try again.", {}
 
+        system_prompt = self._simplified_prompt(user_response, item, session)
+        cache_key = _prompt_cache_key(system_prompt)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return self._simplified_outcome(cached)
+        try:
+            response = await self._llm.generate_async(system_prompt, max_tokens=500,
+                                                      response_schema=_SIMPLIFIED_SCHEMA)
+            return self._simplified_result(response, cache_key)
+        except Exception as e:
+            return self._simplified_error(e)
+
+    async def evaluate_simplified_stream(self, user_response: str, item: dict, attempts_so_far: int,
+                                         session: dict = None):
+        """Streaming evaluate_simplified.
+
+        Yields ("delta", text) while the tutor's feedback is generated, then a single
+        ("result", (correctness, next_prompt, hint, evaluation_data)).
+        """
+        trivial = self._trivial_result(user_response, item) or self._repeat_result(
+            user_response, (item.get("ai_guidance") or {}).get("hints", []), attempts_so_far, session, False)
+        if trivial:
+            yield "result", trivial
+            return
+
+        if not self._llm:
+            yield "result", (None, None, "I need to think about this. Let's try again.", {})
+            return
+
+        system_prompt = self._simplified_prompt(user_response, item, session)
+        cache_key = _prompt_cache_key(system_prompt)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            if cached.get("feedback"):
+                yield "delta", cached["feedback"]
+            yield "result", self._simplified_outcome(cached)
+            return
+        try:
+            feedback = JsonFieldStream("feedback")
+            async for chunk in self._llm.generate_stream(system_prompt, max_tokens=500,
+                                                         response_schema=_SIMPLIFIED_SCHEMA):
+                delta = feedback.feed(chunk)
+                if delta:
+                    yield "delta", delta
+            result = self._simplified_result(feedback.buffer, cache_key)
+        except Exception as e:
+            result = self._simplified_error(e)
+        yield "result", result
+
+    def _repeat_result(self, user_response: str, hints: List[Any], attempts_so_far: int,
+                       session: Optional[dict], correctness: Optional[bool]) -> Optional[tuple]:
+        """Next static hint when the student repeats their previous answer, skipping the LLM."""
+        if not _is_repeat_submission(user_response, attempts_so_far, session):
+            return None
+        hint = _pick_hint(hints, attempts_so_far)
+        if not hint:
+            return None
+        evaluation_data = {"learning_insight": "", "misconception_tags": [], "confidence_level": 1.0}
+        return correctness, None, hint, evaluation_data
+
+    def _trivial_result(self, user_response: str, item: dict) -> Optional[Tuple[Optional[bool], Optional[str], Optional[str], dict]]:
+        """Answer blank submissions and exact matches of an accepted answer without the LLM."""
+        evaluation_data = {"learning_insight": "", "misconception_tags": [], "confidence_level": 1.0}
+        normalized = _normalize_answer(user_response or "")
+        if not normalized:
+            return False, None, "Take your time! Have a go at writing your answer, even if you're not sure.", evaluation_data
+
+        answer_details = item.get("answer_details", {})
+        accepted = [a for a in [answer_details.get("correct_answer", "")] + answer_details.get("alternative_answers", [])
+                    if a not in (None, "")]
+        verdict = _triage(user_response, accepted)
+        if verdict == "correct":
+            return True, "Perfect! That's exactly right! 🎉", None, evaluation_data
+        if verdict == "wrong":
+            return False, None, "No worries! Let's work it out together. What is the question asking you to find?", evaluation_data
+        return None
+
+    def _simplified_prompt(self, user_response: str, item: dict, session: dict = None) -> str:
         # Extract answer details and AI guidance from new structure
         answer_details = item.get("answer_details", {})
         ai_guidance = item.get("ai_guidance", {})
@@ -52,7 +439,7 @@ class SimpleOrchestrator:
             conversation_history = session.get("conversation_history", [])
 
         # Build AI evaluation prompt using the simplified, focused structure
-        system_prompt = f"""You are a patient Primary 6 Mathematics tutor in a learning app designed specifically for Singapore primary school students. Stay focused on helping with mathematics learning only.
+        return f"""You are a patient Primary 6 Mathematics tutor in a learning app designed specifically for Singapore primary school students. Stay focused on helping with mathematics learning only.
 
 PROBLEM: {item.get('problem_text', '')}
 CORRECT ANSWER: {correct_answer}
@@ -81,37 +468,42 @@ Example responses:
 - Wrong: "I can see your thinking, but let's look at this part of the problem again..."
 """
 
-        try:
-            response = self._llm.generate(system_prompt, max_tokens=500)
-            result = self._llm.parse_json_response(response, {
-                "is_correct": False,
-                "feedback": "Let me think about that...",
-                "should_advance": False
-            })
-
-            correctness = result.get("is_correct", False)
-            feedback = result.get("feedback", "")
-            should_advance = result.get("should_advance", False)
-            
-            # Use feedback as both next_prompt and hint for the simplified structure
-            next_prompt = feedback if correctness else None
-            hint = feedback if not correctness else None
-            
-            # Prepare evaluation data
-            evaluation_data = {
-                "learning_insight": feedback,
-                "misconception_tags": [],  # Simplified - no longer extracting specific misconceptions
-                "confidence_level": 0.9 if correctness else 0.7
-            }
-
-            return correctness, next_prompt, hint, evaluation_data
+    def _simplified_result(self, response: str,
+                           cache_key: Optional[str] = None) -> Tuple[Optional[bool], Optional[str], Optional[str], dict]:
+        result = self._llm.parse_json_response(response, {
+            "is_correct": False,
+            "feedback": "Let me think about that...",
+            "should_advance": False
+        })
+        # Only replies that parsed are cached; failures raise before this point
+        if cache_key and isinstance(result, dict):
+            self._cache.set(cache_key, result)
+        return self._simplified_outcome(result)
 
-        except Exception as e:
-            print(f"AI evaluation failed: {e}")
-            # TRUE AI-FIRST: No fallback evaluation - transparent failure
-            return None, None, "Oops! I need a moment to think about your answer. Please try submitting it again!", {
-                "error": f"AI_EVALUATION_FAILED: {str(e)}"
-            }
+    def _simplified_outcome(self, result: dict) -> Tuple[Optional[bool], Optional[str], Optional[str], dict]:
+        correctness = result.get("is_correct", False)
+        feedback = result.get("feedback", "")
+        should_advance = result.get("should_advance", False)
+        
+        # Use feedback as both next_prompt and hint for the simplified structure
+        next_prompt = feedback if correctness else None
+        hint = feedback if not correctness else None
+        
+        # Prepare evaluation data
+        evaluation_data = {
+            "learning_insight": feedback,
+            "misconception_tags": [],  # Simplified - no longer extracting specific misconceptions
+            "confidence_level": 0.9 if correctness else 0.7
+        }
+
+        return correctness, next_prompt, hint, evaluation_data
+
+    def _simplified_error(self, e: Exception) -> Tuple[Optional[bool], Optional[str], Optional[str], dict]:
+        logger.warning("AI evaluation failed: %s", e)
+        # TRUE AI-FIRST: No fallback evaluation - transparent failure
+        return None, None, "Oops! I need a moment to think about your answer. Please try submitting it again!", {
+            "error": f"AI_EVALUATION_FAILED: {str(e)}"
+        }
 
     def evaluate(self, user_response: str, item: dict, step: dict, attempts_so_far: int, 
                 session: dict = None) -> Tuple[Optional[bool], Optional[str], Optional[str], Optional[str]]:
@@ -124,6 +516,31 @@ Example responses:
             # Fallback if LLM is not available
             return None, None, "I need to think about this. Let's try again.", None
 
+        repeat = self._repeat_result(user_response, step.get("hints", []), attempts_so_far, session, None)
+        if repeat:
+            return repeat
+
+        ai_response = self._llm.evaluate_and_respond(
+            **self._evaluation_inputs(user_response, item, step, attempts_so_far, session))
+        return self._evaluation_outcome(ai_response)
+
+    async def evaluate_async(self, user_response: str, item: dict, step: dict, attempts_so_far: int,
+                             session: dict = None) -> Tuple[Optional[bool], Optional[str], Optional[str], Optional[str]]:
+        """Async evaluate: awaits the LLM so one event loop can serve many sessions."""
+        if not self._llm:
+            # Fallback if LLM is not available
+            return None, None, "I need to think about this. Let's try again.", None
+
+        repeat = self._repeat_result(user_response, step.get("hints", []), attempts_so_far, session, None)
+        if repeat:
+            return repeat
+
+        ai_response = await self._llm.evaluate_and_respond_async(
+            **self._evaluation_inputs(user_response, item, step, attempts_so_far, session))
+        return self._evaluation_outcome(ai_response)
+
+    def _evaluation_inputs(self, user_response: str, item: dict, step: dict, attempts_so_far: int,
+                           session: dict = None) -> Dict[str, Any]:
         # Extract hints from step to use as guidelines
         hints_guidelines = step.get("hints", [])
         
@@ -149,8 +566,8 @@ Example responses:
                 ])
                 learning_insights.append({"insight": misconception_text, "confidence": 1.0})
 
-        # Use AI to evaluate and respond
-        ai_response = self._llm.evaluate_and_respond(
+        # Inputs for the AI to evaluate and respond
+        return dict(
             problem_text=item.get("problem_text", ""),
             step_prompt=step.get("prompt", ""),
             user_response=user_response,
@@ -161,6 +578,7 @@ Example responses:
             learning_insights=learning_insights
         )
 
+    def _evaluation_outcome(self, ai_response: Dict[str, Any]) -> Tuple[Optional[bool], Optional[str], Optional[str], Optional[dict]]:
         is_correct = ai_response.get("is_correct", False)
         response_text = ai_response.get("response", "Let's try again.")
         should_advance = ai_response.get("should_advance", False)
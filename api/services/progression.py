@@ -1,5 +1,40 @@
 from __future__ import annotations
-from typing import List, Dict, Optional, Any
+import logging
+from functools import lru_cache
+from operator import itemgetter
+from types import MappingProxyType
+from typing import AbstractSet, Any, Collection, Dict, List, Mapping, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+_DIFFICULTY_MAP = {"Easy": 0.3, "Medium": 0.6, "Hard": 0.9}
+
+# Common topic patterns in item IDs, in the order they are scanned for
+_TOPIC_PATTERNS = ("ALGEBRA", "FRACTIONS", "GEOMETRY", "PERCENTAGE", "RATIO", "SPEED", "STATISTICS")
+_KNOWN_TOPICS = frozenset(pattern.lower() for pattern in _TOPIC_PATTERNS)
+
+_ITEMS_REPO = None
+
+
+def _items_repo():
+    """The container's ITEMS_REPO, imported on first use to avoid a circular import."""
+    global _ITEMS_REPO
+    if _ITEMS_REPO is None:
+        from services.container import ITEMS_REPO
+        _ITEMS_REPO = ITEMS_REPO
+    return _ITEMS_REPO
+
+
+def _as_set(completed_items: Collection[str]) -> AbstractSet[str]:
+    """completed_items for O(1) membership, reusing the caller's set when it already is one."""
+    if isinstance(completed_items, (set, frozenset)):
+        return completed_items
+    return frozenset(completed_items)
+
+
+def _progression_key(topic_name: str, subtopic_filter: Optional[str]) -> Tuple[str, Optional[str]]:
+    """Case-folded (topic, subtopic) so every spelling of a progression shares one cache entry."""
+    return topic_name.lower(), (subtopic_filter.lower() if subtopic_filter else None)
 
 
 class ProgressionService:
@@ -10,114 +45,104 @@ class ProgressionService:
     
     def get_topic_progression(self, topic_name: str, subtopic_filter: str = None) -> List[str]:
         """Get ordered list of item IDs for any topic progression, optionally filtered by subtopic."""
-        # Import here to avoid circular dependency
-        from services.container import ITEMS_REPO
+        items_repo = _items_repo()
         
-        print(f"🔍 DEBUG: get_topic_progression called with topic='{topic_name}', subtopic_filter='{subtopic_filter}'")
-        
-        # Get all items for the specified topic from the repository
-        available_items = []
-        
-        # Auto-discover items for this topic
-        topic_item_ids = self._discover_topic_items(topic_name)
+        # Progressions only change when the items do; the repo version keys the cache
+        version = getattr(items_repo, "version", None)
+        return list(self._get_topic_progression_cached(*_progression_key(topic_name, subtopic_filter), version))
+    
+    def _topic_progression_view(self, topic_name: str, subtopic_filter: str = None) -> Tuple[Tuple[str, ...], Mapping[str, int]]:
+        """The cached progression (not copied) and its item ID -> index map, read at one repo version."""
+        items_repo = _items_repo()
         
-        for item_id in topic_item_ids:
-            item = ITEMS_REPO.get_item(item_id)
-            if item:
-                # Extract complexity-based difficulty
-                complexity = item.get("complexity", "Easy")
-                difficulty_map = {"Easy": 0.3, "Medium": 0.6, "Hard": 0.9}
-                difficulty = difficulty_map.get(complexity, 0.5)
-                
-                # Extract subtopic order from sub_topic field
-                sub_topic = item.get("sub_topic", "")
-                subtopic_order = self._extract_subtopic_order(sub_topic)
-                
-                # Extract question number from ID  
-                question_num = self._extract_question_number(item_id)
-                
-                # Apply subtopic filter if specified
-                if subtopic_filter:
-                    # Check if this item matches the subtopic filter
-                    if not self._matches_subtopic(item_id, sub_topic, subtopic_filter):
-                        print(f"🔍 DEBUG: Skipping {item_id} - doesn't match subtopic filter '{subtopic_filter}' (item sub_topic: '{sub_topic}')")
-                        continue
-                    print(f"🔍 DEBUG: Including {item_id} - matches subtopic filter '{subtopic_filter}' (item sub_topic: '{sub_topic}')")
-                
-                available_items.append({
-                    "id": item_id,
-                    "difficulty": difficulty,
-                    "complexity": complexity,
-                    "subtopic_order": subtopic_order,
-                    "question_num": question_num,
-                    "sub_topic": sub_topic
-                })
+        version = getattr(items_repo, "version", None)
+        key = _progression_key(topic_name, subtopic_filter)
+        return self._get_topic_progression_cached(*key, version), self._positions_cached(*key, version)
+    
+    @lru_cache(maxsize=128)
+    def _positions_cached(self, topic_name: str, subtopic_filter: Optional[str],
+                          repo_version: Optional[int]) -> Mapping[str, int]:
+        progression = self._get_topic_progression_cached(topic_name, subtopic_filter, repo_version)
+        return MappingProxyType({item_id: i for i, item_id in enumerate(progression)})
+    
+    @lru_cache(maxsize=128)
+    def _get_topic_progression_cached(self, topic_name: str, subtopic_filter: Optional[str],
+                                      repo_version: Optional[int]) -> Tuple[str, ...]:
+        ordered = self._sorted_topic_items(topic_name, repo_version)
+        
+        # Filtering the pre-sorted list keeps the same order a fresh sort would give
+        if subtopic_filter:
+            filter_lower, filter_upper = subtopic_filter, subtopic_filter.upper()
+            result_ids = tuple(item_id for item_id, sub_topic_lower, item_id_upper in ordered
+                               if self._matches_subtopic(item_id_upper, sub_topic_lower, filter_lower, filter_upper))
+        else:
+            result_ids = tuple(item_id for item_id, _, _ in ordered)
+        logger.debug("Progression for topic=%r subtopic=%r: %d items", topic_name, subtopic_filter, len(result_ids))
+        return result_ids
+    
+    @lru_cache(maxsize=64)
+    def _sorted_topic_items(self, topic_name: str, repo_version: Optional[int]) -> Tuple[Tuple[str, str, str], ...]:
+        """(item_id, lowercased sub_topic, uppercased item_id) for a topic, in progression order."""
+        records = self._item_records(repo_version)
+        rows = [(item_id, *records[item_id]) for item_id in self._discover_topic_items(topic_name)
+                if item_id in records]
         
         # Sort by subtopic order, then question number, then difficulty
-        available_items.sort(key=lambda x: (x["subtopic_order"], x["question_num"], x["difficulty"]))
-        
-        result_ids = [item["id"] for item in available_items]
-        print(f"🔍 DEBUG: get_topic_progression returning {len(result_ids)} items: {result_ids[:3]}..." if result_ids else "🔍 DEBUG: get_topic_progression returning 0 items")
-        return result_ids
+        rows.sort(key=itemgetter(1))
+        return tuple((item_id, sub_topic_lower, item_id_upper) for item_id, _, sub_topic_lower, item_id_upper in rows)
+    
+    @lru_cache(maxsize=1)
+    def _item_records(self, repo_version: Optional[int]) -> Dict[str, Tuple[Tuple[int, int, float], str, str]]:
+        """(sort key, lowercased sub_topic, uppercased id) for every item, built once per repo version.
+
+        The sort key is (subtopic_order, question_num, difficulty); the case-folded
+        strings let subtopic filtering compare without re-casing per call.
+        """
+        items_repo = _items_repo()
+        
+        records = {}
+        for item_id, item in items_repo.get_all_items().items():
+            if not item:
+                continue
+            sub_topic = item.get("sub_topic", "")
+            # Extract complexity-based difficulty
+            difficulty = _DIFFICULTY_MAP.get(item.get("complexity", "Easy"), 0.5)
+            # Extract subtopic order from sub_topic field
+            subtopic_order = self._extract_subtopic_order(sub_topic)
+            # Extract question number from ID
+            question_num = self._extract_question_number(item_id)
+            records[item_id] = ((subtopic_order, question_num, difficulty), sub_topic.lower(), item_id.upper())
+        return records
     
     
     def _discover_topic_items(self, topic_name: str) -> List[str]:
         """Auto-discover all items for a given topic in the repository."""
-        # Import here to avoid circular dependency
-        from services.container import ITEMS_REPO
-        
-        # Get all items from repository and find ones matching this topic
-        all_items = ITEMS_REPO.get_all_items()
-        topic_items = []
-        
-        # Convert topic name to uppercase for matching (e.g., "fractions" -> "FRACTIONS")
-        topic_upper = topic_name.upper()
-        print(f"🔍 DEBUG: Looking for items STARTING WITH '{topic_upper}-' in {len(all_items)} total items")
+        items_repo = _items_repo()
         
-        for item_id, item_data in all_items.items():
-            # Check if item ID STARTS WITH the topic name followed by a hyphen
-            # This prevents "FRACTIONS" from matching "RATIO-RATIOS-AND-FRACTIONS-Q9"
-            item_id_upper = item_id.upper()
-            if item_id_upper.startswith(f"{topic_upper}-"):
-                topic_items.append(item_id)
-                print(f"🔍 DEBUG: Found {topic_name} item: {item_id}")
-            else:
-                # Also check the actual topic field in the item data for more precision
-                item_topic = item_data.get('topic', '').lower() if item_data else ''
-                if item_topic == topic_name.lower():
-                    topic_items.append(item_id)
-                    print(f"🔍 DEBUG: Found {topic_name} item by topic field: {item_id}")
-        
-        print(f"🔍 DEBUG: Found {len(topic_items)} items for topic '{topic_name}': {topic_items[:10]}...")
-        return topic_items
-        
-    def _matches_subtopic(self, item_id: str, item_sub_topic: str, subtopic_filter: str) -> bool:
-        """Check if an item matches the subtopic filter using subtopic IDs."""
-        print(f"🔍 DEBUG: _matches_subtopic checking '{item_id}' against filter '{subtopic_filter}'")
-        print(f"🔍 DEBUG: _matches_subtopic item_sub_topic: '{item_sub_topic}'")
+        # Index lookup covers both ID-prefix matches ("FRACTIONS-..." but not
+        # "RATIO-RATIOS-AND-FRACTIONS-Q9") and the item's own topic field
+        return items_repo.get_topic_item_ids(topic_name)
         
+    @staticmethod
+    def _matches_subtopic(item_id_upper: str, sub_topic_lower: str, filter_lower: str, filter_upper: str) -> bool:
+        """Check if an item matches the subtopic filter using subtopic IDs (inputs already case-folded)."""
         # PRIMARY: Check exact match with sub_topic field (subtopic ID)
-        if item_sub_topic and item_sub_topic.lower() == subtopic_filter.lower():
-            print(f"🔍 DEBUG: _matches_subtopic EXACT MATCH by sub_topic: '{item_sub_topic}' == '{subtopic_filter}'")
+        if sub_topic_lower and sub_topic_lower == filter_lower:
             return True
             
         # FALLBACK: Check if item ID contains the subtopic pattern (for legacy data)
-        filter_upper = subtopic_filter.upper()
-        item_id_upper = item_id.upper()
-        if filter_upper in item_id_upper:
-            print(f"🔍 DEBUG: _matches_subtopic FALLBACK MATCH by ID: '{filter_upper}' in '{item_id_upper}'")
-            return True
-        
-        print(f"🔍 DEBUG: _matches_subtopic NO MATCH")    
-        return False
+        return filter_upper in item_id_upper
     
     def _extract_topic_from_item_id(self, item_id: str) -> str:
         """Extract topic name from item ID (e.g., 'FRACTIONS-Q1' -> 'fractions')."""
-        # Common topic patterns in item IDs
-        topic_patterns = ["ALGEBRA", "FRACTIONS", "GEOMETRY", "PERCENTAGE", "RATIO", "SPEED", "STATISTICS"]
+        # Fast path: the ID prefix names the topic ("RATIO-RATIOS-AND-FRACTIONS-Q9" -> ratio)
+        prefix = item_id.split("-", 1)[0].lower()
+        if prefix in _KNOWN_TOPICS:
+            return prefix
         
-        for pattern in topic_patterns:
-            if pattern in item_id.upper():
+        item_id_upper = item_id.upper()
+        for pattern in _TOPIC_PATTERNS:
+            if pattern in item_id_upper:
                 return pattern.lower()
         
         # NO FALLBACKS - return unknown if pattern not recognized
@@ -125,116 +150,90 @@ class ProgressionService:
     
     def get_available_topics(self) -> List[str]:
         """Get list of all available topics from repository items."""
-        # Import here to avoid circular dependency
-        from services.container import ITEMS_REPO
-        
-        all_items = ITEMS_REPO.get_all_items()
-        topics = set()
+        items_repo = _items_repo()
         
-        for item_id in all_items.keys():
-            topic = self._extract_topic_from_item_id(item_id)
-            topics.add(topic)
-        
-        return sorted(list(topics))
+        return list(self._available_topics_cached(getattr(items_repo, "version", None)))
+    
+    @lru_cache(maxsize=1)
+    def _available_topics_cached(self, repo_version: Optional[int]) -> Tuple[str, ...]:
+        topics = {self._extract_topic_from_item_id(item_id) for item_id in self._item_records(repo_version)}
+        return tuple(sorted(topics))
     
     
-    def _extract_subtopic_order(self, sub_topic: str) -> int:
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _extract_subtopic_order(sub_topic: str) -> int:
         """Extract subtopic order from sub_topic string like '1.1 Introduction to Algebra'."""
-        if not sub_topic:
-            return 0
-        try:
-            # Extract the number before the first dot (e.g., "1.1" -> 1)
-            parts = sub_topic.split(".")
-            if len(parts) >= 2:
-                return int(float(sub_topic.split()[0]) * 10)  # 1.1 -> 11, 1.2 -> 12
+        if not sub_topic or "." not in sub_topic:
             return 0
-        except (ValueError, IndexError):
+        # Leading "major.minor" section number, in integer arithmetic: 1.1 -> 11, 1.2 -> 12
+        major, dot, minor = sub_topic.split(None, 1)[0].partition(".")
+        if not dot or not major.isdecimal() or (minor and not minor[0].isdecimal()):
             return 0
+        return int(major) * 10 + (int(minor[0]) if minor else 0)
     
-    def _extract_question_number(self, item_id: str) -> int:
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _extract_question_number(item_id: str) -> int:
         """Extract question number from item ID like 'ALGEBRA-INTRODUCTION-TO-ALGEBRA-Q5'."""
         try:
             if "-Q" in item_id:
-                return int(item_id.split("-Q")[-1])
+                return int(item_id.rsplit("-Q", 1)[-1])
             return 0
         except (ValueError, IndexError):
             return 0
     
-    def get_next_item_id(self, current_item_id: str, completed_items: List[str], topic_name: str, subtopic_filter: str = None) -> Optional[str]:
+    def get_next_item_id(self, current_item_id: str, completed_items: Collection[str], topic_name: str, subtopic_filter: str = None) -> Optional[str]:
         """Get the next item ID in the progression for any topic."""
-        progression = self.get_topic_progression(topic_name, subtopic_filter)
-        print(f"🔍 DEBUG: get_next_item_id called with current='{current_item_id}', topic='{topic_name}', subtopic='{subtopic_filter}'")
-        print(f"🔍 DEBUG: get_next_item_id progression has {len(progression)} items: {progression[:3]}...")
-        print(f"🔍 DEBUG: get_next_item_id completed_items: {completed_items}")
-        
-        try:
-            current_index = progression.index(current_item_id)
-            print(f"🔍 DEBUG: get_next_item_id found current item at index {current_index}")
-            # Get next item that hasn't been completed
-            for i in range(current_index + 1, len(progression)):
-                next_item_id = progression[i]
-                if next_item_id not in completed_items:
-                    print(f"🔍 DEBUG: get_next_item_id returning next item: {next_item_id}")
-                    return next_item_id
-                else:
-                    print(f"🔍 DEBUG: get_next_item_id skipping completed item: {next_item_id}")
-            print(f"🔍 DEBUG: get_next_item_id no more items after current")
-            return None  # No more items
-        except ValueError:
-            print(f"🔍 DEBUG: get_next_item_id current item not in progression, returning first available")
-            # Current item not in progression, return first available
-            for item_id in progression:
-                if item_id not in completed_items:
-                    print(f"🔍 DEBUG: get_next_item_id returning first available: {item_id}")
-                    return item_id
-                else:
-                    print(f"🔍 DEBUG: get_next_item_id skipping completed item: {item_id}")
-            print(f"🔍 DEBUG: get_next_item_id no available items")
-            return None
+        progression, positions = self._topic_progression_view(topic_name, subtopic_filter)
+        return self._next_uncompleted(progression, positions, current_item_id, _as_set(completed_items))
+    
+    @staticmethod
+    def _next_uncompleted(progression: Sequence[str], positions: Mapping[str, int],
+                          current_item_id: str, completed_set: AbstractSet[str]) -> Optional[str]:
+        """First item after current_item_id (or from the start, if it isn't in the progression) not yet completed."""
+        # Current item not in progression -> -1, i.e. return first available
+        start = positions.get(current_item_id, -1) + 1
+        for i in range(start, len(progression)):
+            if progression[i] not in completed_set:
+                return progression[i]
+        return None  # No more items
     
-    def get_progression_status(self, completed_items: List[str], topic_name: str) -> Dict[str, Any]:
-        """Get overall progression status for any topic."""
-        progression = self.get_topic_progression(topic_name)
+    def get_progression_status(self, completed_items: Sequence[str], topic_name: str) -> Dict[str, Any]:
+        """Get overall progression status for any topic (completed_items in completion order)."""
+        progression, positions = self._topic_progression_view(topic_name)
         total_items = len(progression)
-        completed_count = len([item_id for item_id in completed_items if item_id in progression])
+        completed_set = frozenset(completed_items)
+        completed_count = len(positions.keys() & completed_set)
+        next_item_id = self._next_uncompleted(progression, positions, completed_items[-1] if completed_items else "",
+                                              completed_set)
         
         return {
             "total_items": total_items,
             "completed_count": completed_count,
             "completion_percentage": (completed_count / total_items * 100) if total_items > 0 else 0,
-            "next_item_id": self.get_next_item_id(completed_items[-1] if completed_items else "", completed_items, topic_name),
-            "progression_items": progression
+            "next_item_id": next_item_id,
+            "progression_items": list(progression)
         }
     
     def recommend_next_session(self, learner_profile: Dict[str, Any], topic_name: str, subtopic_filter: str = None) -> Optional[str]:
         """Recommend next item based on learner's progress and performance for any topic, optionally filtered by subtopic."""
-        completed_items = learner_profile.get("completed_items", [])
-        progression = self.get_topic_progression(topic_name, subtopic_filter)
-        print(f"🔍 DEBUG: recommend_next_session for '{topic_name}' (subtopic: '{subtopic_filter}') - progression has {len(progression)} items")
-        print(f"🔍 DEBUG: First 5 progression items: {progression[:5] if progression else 'NONE'}")
+        # Ordered list, oldest first: the most recent in-topic item is found from the end
+        completed_items: Sequence[str] = learner_profile.get("completed_items", [])
+        progression, positions = self._topic_progression_view(topic_name, subtopic_filter)
         
         # NO FALLBACKS - If no progression found, fail clearly
         if not progression:
-            print(f"🔍 DEBUG: No progression found for topic '{topic_name}'")
+            logger.debug("No progression found for topic %r (subtopic %r)", topic_name, subtopic_filter)
             return None
         
-        # Filter completed items to only include items from this topic
-        topic_completed = [item_id for item_id in completed_items if item_id in progression]
+        # Last completed item FROM THIS TOPIC, not globally (scanning back from the newest)
+        last_completed_in_topic = next((item_id for item_id in reversed(completed_items) if item_id in positions), None)
         
         # If no completed items in this topic, start with first item in progression
-        if not topic_completed:
-            recommended = progression[0]
-            print(f"🔍 DEBUG: No completed items in topic, recommending first: {recommended}")
-            return recommended
+        if last_completed_in_topic is None:
+            return progression[0]
         
         # For now, simple sequential progression
         # TODO: Add adaptive logic based on performance, misconceptions, etc.
-        # Use the last completed item FROM THIS TOPIC, not globally
-        last_completed_in_topic = topic_completed[-1]
-        recommended = self.get_next_item_id(last_completed_in_topic, completed_items, topic_name, subtopic_filter)
-        print(f"🔍 DEBUG: Recommending next after {last_completed_in_topic}: {recommended}")
-        return recommended
-
-
-# Global progression service instance
-PROGRESSION_SERVICE = ProgressionService()
\ No newline at end of file
+        return self._next_uncompleted(progression, positions, last_completed_in_topic, frozenset(completed_items))
@@ -1,15 +1,42 @@
 from __future__ import annotations
 from dataclasses import dataclass, field
-from typing import Dict, Optional, Any
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Any
 import uuid
 
+# Most recent conversation entries kept per in-memory session
+MAX_CONVERSATION_HISTORY = 500
 
-@dataclass
+
+def build_topic_index(items: Dict[str, dict]) -> Dict[str, List[str]]:
+    """Map lowercased topic -> item ids, in repo order.
+
+    An item is filed under every hyphen-delimited prefix of its id
+    ("FRACTIONS-ADDING-Q1" -> "fractions", "fractions-adding") and under its
+    topic field, so a lookup matches both `id.startswith(f"{TOPIC}-")` and
+    `item["topic"] == topic`.
+    """
+    index: Dict[str, List[str]] = {}
+    for item_id, item_data in items.items():
+        keys = {item_id[:i].lower() for i, c in enumerate(item_id) if c == "-"}
+        topic = (item_data or {}).get("topic")
+        if topic:
+            keys.add(topic.lower())
+        for key in keys:
+            index.setdefault(key, []).append(item_id)
+    return index
+
+
+@dataclass(slots=True)
 class InMemoryItemsRepo:
     items: Dict[str, dict] = field(default_factory=dict)
+    version: int = 0  # bumped on every mutation so derived caches can invalidate
+    _topic_index: Dict[str, List[str]] = field(default_factory=dict, init=False, repr=False)
+    _topic_index_version: int = field(default=-1, init=False, repr=False)
 
     def put_item(self, item: dict):
         self.items[item["id"]] = item
+        self.version += 1
 
     def get_item(self, item_id: str) -> Optional[dict]:
         return self.items.get(item_id)
@@ -18,25 +45,33 @@ class InMemoryItemsRepo:
         """Get all items in the repository."""
         return self.items.copy()
 
+    def get_topic_item_ids(self, topic: str) -> List[str]:
+        """Item ids for a topic via the prebuilt index (rebuilt only after mutations)."""
+        if self._topic_index_version != self.version:
+            self._topic_index = build_topic_index(self.items)
+            self._topic_index_version = self.version
+        return list(self._topic_index.get(topic.lower(), []))
 
-@dataclass
+
+@dataclass(slots=True)
 class InMemorySessionsRepo:
     sessions: Dict[str, dict] = field(default_factory=dict)
 
     def create_session(self, learner_id: str, item_id: str) -> str:
-        sid = str(uuid.uuid4())
+        sid = uuid.uuid4().hex
         self.sessions[sid] = {
             "id": sid,
             "learner_id": learner_id,
             "item_id": item_id,
             "steps": [],  # log of interactions
-            "conversation_history": [],  # chronological conversation for AI context
             "current_step_idx": 0,
             "attempts_current": 0,
             "hints_used": 0,
             "finished": False,
-            "learning_insights": [],  # AI-observed learning patterns
-            "misconceptions": {},  # Track misconception frequency
+            # Created on first write, since many sessions never use them:
+            #   "conversation_history": chronological conversation for AI context
+            #   "learning_insights": AI-observed learning patterns
+            #   "misconceptions": misconception frequency tracking
         }
         return sid
 
@@ -53,64 +88,70 @@ class InMemorySessionsRepo:
         self.sessions[session_id]["attempts_current"] = 0
 
     def advance_step(self, session_id: str):
-        self.sessions[session_id]["current_step_idx"] += 1
-        self.reset_attempts(session_id)
+        session = self.sessions[session_id]
+        session["current_step_idx"] += 1
+        session["attempts_current"] = 0
 
-    def mark_finished(self, session_id: str):
+    def mark_finished(self, session_id: str, learner_id: Optional[str] = None, started_at=None):
         self.sessions[session_id]["finished"] = True
 
     def add_to_conversation(self, session_id: str, role: str, message: str, metadata: dict = None):
         """Add message to conversation history with timestamp."""
-        import datetime
         entry = {
-            "timestamp": datetime.datetime.utcnow().isoformat(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
             "role": role,  # 'student', 'tutor', 'system'
             "message": message,
             "metadata": metadata or {}
         }
-        self.sessions[session_id]["conversation_history"].append(entry)
+        history = self.sessions[session_id].setdefault("conversation_history", [])
+        history.append(entry)
+        # Bounded so long sessions don't grow without limit; AI context only reads the tail
+        if len(history) > MAX_CONVERSATION_HISTORY:
+            del history[:-MAX_CONVERSATION_HISTORY]
 
     def get_conversation_history(self, session_id: str, limit: int = 10) -> list:
         """Get recent conversation history for AI context."""
-        history = self.sessions[session_id]["conversation_history"]
+        history = self.sessions[session_id].get("conversation_history", [])
         return history[-limit:] if limit else history
 
     def add_learning_insight(self, session_id: str, insight: str, confidence: float = 1.0):
         """Record AI-observed learning patterns."""
-        import datetime
         entry = {
-            "timestamp": datetime.datetime.utcnow().isoformat(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
             "insight": insight,
             "confidence": confidence
         }
-        self.sessions[session_id]["learning_insights"].append(entry)
+        self.sessions[session_id].setdefault("learning_insights", []).append(entry)
 
     def record_misconceptions(self, session_id: str, misconception_tags: list, confidence: float = 1.0):
         """Record identified misconceptions with frequency tracking."""
-        import datetime
-        session = self.sessions[session_id]
+        misconceptions = self.sessions[session_id].setdefault("misconceptions", {})
+        # One timestamp for the whole batch of tags
+        now = datetime.now(timezone.utc).isoformat()
         for tag in misconception_tags:
-            if tag not in session["misconceptions"]:
-                session["misconceptions"][tag] = {
+            entry = misconceptions.get(tag)
+            if entry is None:
+                entry = misconceptions[tag] = {
                     "count": 0,
-                    "first_seen": datetime.datetime.utcnow().isoformat(),
-                    "last_seen": datetime.datetime.utcnow().isoformat(),
-                    "confidence_scores": []
+                    "first_seen": now,
+                    "last_seen": now,
+                    "confidence_sum": 0.0,
                 }
-            session["misconceptions"][tag]["count"] += 1
-            session["misconceptions"][tag]["last_seen"] = datetime.datetime.utcnow().isoformat()
-            session["misconceptions"][tag]["confidence_scores"].append(confidence)
+            entry["count"] += 1
+            entry["last_seen"] = now
+            # Running sum (with count) instead of a score list, as in the Firestore repo
+            entry["confidence_sum"] += confidence
 
     def get_misconception_summary(self, session_id: str) -> dict:
         """Get summarized misconception data for AI context."""
-        misconceptions = self.sessions[session_id]["misconceptions"]
+        misconceptions = self.sessions[session_id].get("misconceptions", {})
         return {
-            tag: {"count": data["count"], "avg_confidence": sum(data["confidence_scores"]) / len(data["confidence_scores"])}
+            tag: {"count": data["count"], "avg_confidence": data["confidence_sum"] / data["count"]}
             for tag, data in misconceptions.items()
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class InMemoryProfilesRepo:
     profiles: Dict[str, dict] = field(default_factory=dict)
 
@@ -148,8 +189,7 @@ class InMemoryProfilesRepo:
         p["current_session_id"] = None
 
     def create_learner(self, *, name: str, grade_level: str = "P6", subjects: Optional[list[str]] = None, learner_id: Optional[str] = None) -> str:
-        import uuid
-        lid = learner_id or str(uuid.uuid4())
+        lid = learner_id or uuid.uuid4().hex
         p = self.get_profile(lid)
         p["name"] = name or "Your Learner"
         p["grade_level"] = grade_level or "P6"
@@ -158,7 +198,7 @@ class InMemoryProfilesRepo:
         return lid
 
 
-@dataclass
+@dataclass(slots=True)
 class InMemoryParentsRepo:
     parents: Dict[str, dict] = field(default_factory=dict)
 
@@ -171,4 +211,5 @@ class InMemoryParentsRepo:
             p["children"].append(learner_id)
 
     def list_children(self, parent_uid: str) -> list[str]:
-        return list(self._get(parent_uid)["children"])
+        """The parent's children list itself (not a copy); callers must treat it as read-only."""
+        return self._get(parent_uid)["children"]
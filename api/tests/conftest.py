@@ -0,0 +1,11 @@
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture(scope="session")
+def client():
+    # Imported here so unit tests that never touch the app don't need its LLM configuration
+    from main import app
+
+    # Shared across tests; not entered as a context manager, so startup hooks stay off as before
+    return TestClient(app)
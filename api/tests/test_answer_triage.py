@@ -0,0 +1,115 @@
+import json
+
+import pytest
+
+from services.llm import ResponseCache
+from services.orchestrator import SimpleOrchestrator, _normalize_answer, _triage
+
+
+@pytest.mark.parametrize("answer, expected", [
+    ("b + 4", "b+4"),
+    ("  B+4 ", "b+4"),
+    ("1  1/2", "1 1/2"),
+    ("5 teams", "5 teams"),
+])
+def test_normalize_drops_only_cosmetic_whitespace(answer, expected):
+    assert _normalize_answer(answer) == expected
+
+
+@pytest.mark.parametrize("answer, expected", [
+    ("11/2", "1 1/2"),
+    ("23/4", "2 3/4"),
+    ("34", "3 4"),
+])
+def test_normalize_keeps_mixed_numbers_distinct(answer, expected):
+    assert _normalize_answer(answer) != _normalize_answer(expected)
+
+
+@pytest.mark.parametrize("answer, expected", [
+    ("11/2", "1 1/2"),
+    ("23/4", "2 3/4"),
+    ("3 4", "34"),
+])
+def test_triage_never_accepts_merged_mixed_numbers(answer, expected):
+    assert _triage(answer, [expected]) != "correct"
+
+
+@pytest.mark.parametrize("answer, expected", [
+    ("x>5", "x<5"),
+    ("x>=5", "x>5"),
+    ("23", "2:3"),
+    ("2:3", "3:2"),
+    ("12%", "12"),
+    ("12", "12%"),
+    ("5!", "5"),
+])
+def test_triage_defers_meaningful_symbol_changes(answer, expected):
+    assert _triage(answer, [expected]) == "ambiguous"
+
+
+@pytest.mark.parametrize("answer, expected", [
+    ("b + 4", "b+4"),
+    ("'b+4", "b+4"),
+    ("1 1/2", "1 1/2"),
+    ("4 + b", "b+4"),
+])
+def test_triage_accepts_cosmetic_differences(answer, expected):
+    assert _triage(answer, [expected]) == "correct"
+
+
+@pytest.mark.parametrize("answer, expected", [("½", "1/2"), ("π", "pi"), ("x²", "x^2"), ("三", "3")])
+def test_triage_defers_non_ascii_answers(answer, expected):
+    assert _triage(answer, [expected]) == "ambiguous"
+
+
+@pytest.mark.parametrize("answer", ["", "   ", "???", "idk", "I don't know"])
+def test_triage_rejects_non_attempts(answer):
+    assert _triage(answer, ["b+4"]) == "wrong"
+
+
+class _RecordingLLM:
+    """Stands in for the tutor model and records which answers reached it."""
+
+    def __init__(self):
+        self.prompts = []
+
+    def generate(self, prompt, max_tokens=500, response_schema=None):
+        assert response_schema["required"] == ["is_correct", "feedback", "should_advance"]
+        self.prompts.append(prompt)
+        return '{"is_correct": false, "feedback": "Check the whole number part.", "should_advance": false}'
+
+    def parse_json_response(self, text, fallback):
+        return json.loads(text)
+
+
+def _item(correct, *alternatives):
+    return {"answer_details": {"correct_answer": correct, "alternative_answers": list(alternatives)},
+            "ai_guidance": {"hints": []}}
+
+
+def test_exact_and_rearranged_answers_skip_the_model():
+    llm = _RecordingLLM()
+    orchestrator = SimpleOrchestrator(llm=llm)
+    assert orchestrator.evaluate_simplified("4 + b", _item("b+4"), 0)[0] is True
+    assert orchestrator.evaluate_simplified("1 1/2", _item("1 1/2"), 0)[0] is True
+    assert llm.prompts == []
+
+
+@pytest.mark.parametrize("answer, correct", [("11/2", "1 1/2"), ("x>5", "x<5"), ("12", "12%")])
+def test_lookalike_answers_are_left_to_the_model(answer, correct):
+    llm = _RecordingLLM()
+    correctness, _, hint, _ = SimpleOrchestrator(llm=llm).evaluate_simplified(answer, _item(correct), 0)
+    assert len(llm.prompts) == 1
+    assert correctness is False
+    assert hint == "Check the whole number part."
+
+
+def test_identical_prompts_reuse_the_cached_verdict():
+    llm = _RecordingLLM()
+    orchestrator = SimpleOrchestrator(llm=llm, cache=ResponseCache())
+    first = orchestrator.evaluate_simplified("11/2", _item("1 1/2"), 0)
+    second = orchestrator.evaluate_simplified("11/2", _item("1 1/2"), 1)
+    assert len(llm.prompts) == 1
+    assert second == first
+    orchestrator.evaluate_simplified("13/2", _item("1 1/2"), 0)
+    assert len(llm.prompts) == 2
@@ -0,0 +1,35 @@
+import time
+
+import pytest
+
+from services.orchestrator import canonical_form
+
+
+@pytest.mark.parametrize("expr, expected", [
+    ("b+4", "4+1*b"),
+    ("4 + b", "4+1*b"),
+    ("2*(b+2)-b", "4+1*b"),
+    ("(b+1)^2", "1+2*b+1*b^2"),
+    ("b-b", "0"),
+])
+def test_canonical_form_of_simple_polynomials(expr, expected):
+    assert canonical_form(expr) == expected
+
+
+@pytest.mark.parametrize("expr", [
+    "-" * 5000 + "b",
+    "(" * 150 + "b" + ")" * 150,
+    "((a+b+c+d+e+f)**12)**3",
+    "(a+b+c+d+e+f+g+h)**6",
+    "x**12*x**12*x",
+    "b" + "+b" * 200,
+])
+def test_canonical_form_gives_up_on_oversized_input(expr):
+    start = time.monotonic()
+    assert canonical_form(expr) is None
+    assert time.monotonic() - start < 1
+
+
+@pytest.mark.parametrize("expr", ["x>5", "2:3", "12%", "5 teams", "b/(b+1)"])
+def test_canonical_form_rejects_non_polynomials(expr):
+    assert canonical_form(expr) is None
@@ -0,0 +1,33 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("google.generativeai")
+
+_SCRIPT = Path(__file__).parents[2] / "tools" / "complete_all_subjects.py"
+
+
+@pytest.fixture(scope="module")
+def script():
+    spec = importlib.util.spec_from_file_location("complete_all_subjects", _SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_fresh_run_requests_full_batches(script):
+    assert script.missing_batches([], 45, 20) == [(1, 20), (21, 20), (41, 5)]
+
+
+def test_resume_skips_complete_batches_and_tops_up_short_ones(script):
+    saved = list(range(1, 16)) + list(range(21, 41))  # batch 1 came back with 15 of 20
+    assert script.missing_batches(saved, 60, 20) == [(16, 5), (41, 20)]
+
+
+def test_resume_of_a_complete_subject_requests_nothing(script):
+    assert script.missing_batches(range(1, 41), 40, 20) == []
+
+
+def test_problem_number_reads_the_generated_id(script):
+    assert script.problem_number({"id": "STATISTICS-S1-E17"}) == 17
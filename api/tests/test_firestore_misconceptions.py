@@ -0,0 +1,29 @@
+import pytest
+
+pytest.importorskip("google.cloud.firestore")
+
+from google.cloud.firestore_v1.field_path import FieldPath  # noqa: E402
+
+from services.firestore_repository import _misconception_updates  # noqa: E402
+
+
+def test_each_tag_gets_count_last_seen_and_confidence():
+    updates = _misconception_updates(["sign_error", "operation_error"], 0.8)
+    assert set(updates) == {
+        "misconceptions.sign_error.count", "misconceptions.sign_error.last_seen",
+        "misconceptions.sign_error.confidence_sum", "misconceptions.operation_error.count",
+        "misconceptions.operation_error.last_seen", "misconceptions.operation_error.confidence_sum",
+    }
+
+
+@pytest.mark.parametrize("tag", ["a.b", "sign`error", "order of operations", "x/y"])
+def test_special_characters_stay_inside_one_map_key(tag):
+    for path in _misconception_updates([tag], 1.0):
+        parts = FieldPath.from_string(path).parts
+        assert parts[:2] == ("misconceptions", tag)
+        assert len(parts) == 3
+
+
+def test_blank_and_duplicate_tags_are_skipped():
+    updates = _misconception_updates(["", "  ", "sign_error", "sign_error", None], 1.0)
+    assert len(updates) == 3
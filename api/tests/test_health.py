@@ -1,9 +1,4 @@
-from fastapi.testclient import TestClient
-from main import app
-
-
-def test_healthz():
-    client = TestClient(app)
+def test_healthz(client):
     r = client.get("/healthz")
     assert r.status_code == 200
     body = r.json()
@@ -0,0 +1,49 @@
+import asyncio
+
+from services.llm import ResponseCache, _generate_text_async
+
+
+def test_response_cache_expires_and_evicts():
+    cache = ResponseCache(maxsize=2, ttl=60)
+    cache.set("a", {"v": 1})
+    cache.set("b", {"v": 2})
+    cache.set("c", {"v": 3})
+    assert cache.get("a") is None
+    assert cache.get("c") == {"v": 3}
+
+    expired = ResponseCache(maxsize=2, ttl=-1)
+    expired.set("a", {"v": 1})
+    assert expired.get("a") is None
+
+
+def test_response_cache_returns_copies():
+    cache = ResponseCache()
+    cache.set("a", {"tags": []})
+    cache.get("a")["tags"].append("x")
+    assert cache.get("a") == {"tags": []}
+
+
+class _SlowModel:
+    model_name = "fake"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_content_async(self, contents, generation_config=None):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return contents
+
+
+def test_identical_concurrent_generations_are_coalesced():
+    model = _SlowModel()
+
+    async def run():
+        return await asyncio.gather(
+            _generate_text_async(model, "same prompt", {}, str),
+            _generate_text_async(model, "same prompt", {}, str),
+            _generate_text_async(model, "other prompt", {}, str),
+        )
+
+    assert asyncio.run(run()) == ["same prompt", "same prompt", "other prompt"]
+    assert model.calls == 2
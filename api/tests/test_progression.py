@@ -0,0 +1,61 @@
+import pytest
+
+from services import progression as progression_module
+from services.progression import ProgressionService
+from services.repositories import InMemoryItemsRepo
+
+
+@pytest.fixture
+def repo(monkeypatch):
+    repo = InMemoryItemsRepo()
+    for item_id, sub_topic, complexity in [
+        ("FRACTIONS-B-Q2", "1.2 B", "Easy"),
+        ("FRACTIONS-A-Q10", "1.1 A", "Hard"),
+        ("FRACTIONS-A-Q2", "1.1 A", "Easy"),
+        ("FRACTIONS-B-Q1", "1.2 B", "Medium"),
+    ]:
+        repo.put_item({"id": item_id, "topic": "fractions", "sub_topic": sub_topic, "complexity": complexity})
+    monkeypatch.setattr(progression_module, "_ITEMS_REPO", repo)
+    return repo
+
+
+def test_progression_orders_by_subtopic_then_question(repo):
+    service = ProgressionService()
+    assert service.get_topic_progression("fractions") == [
+        "FRACTIONS-A-Q2", "FRACTIONS-A-Q10", "FRACTIONS-B-Q1", "FRACTIONS-B-Q2"]
+    assert service.get_topic_progression("Fractions", "1.2 b") == ["FRACTIONS-B-Q1", "FRACTIONS-B-Q2"]
+
+
+def test_progression_cache_refreshes_when_items_change(repo):
+    service = ProgressionService()
+    service.get_topic_progression("fractions")
+    repo.put_item({"id": "FRACTIONS-A-Q1", "topic": "fractions", "sub_topic": "1.1 A"})
+    assert service.get_topic_progression("fractions")[0] == "FRACTIONS-A-Q1"
+
+
+def test_progression_returns_a_private_copy(repo):
+    service = ProgressionService()
+    service.get_topic_progression("fractions").clear()
+    assert len(service.get_topic_progression("fractions")) == 4
+
+
+def test_next_item_skips_completed_and_accepts_sets(repo):
+    service = ProgressionService()
+    completed = {"FRACTIONS-A-Q10"}
+    assert service.get_next_item_id("FRACTIONS-A-Q2", completed, "fractions") == "FRACTIONS-B-Q1"
+    assert service.get_next_item_id("UNKNOWN", [], "fractions") == "FRACTIONS-A-Q2"
+    assert service.get_next_item_id("FRACTIONS-B-Q2", [], "fractions") is None
+
+
+def test_status_and_recommendation_follow_completion_order(repo):
+    service = ProgressionService()
+    completed = ["FRACTIONS-B-Q1", "ALGEBRA-Q1", "FRACTIONS-A-Q2"]
+
+    status = service.get_progression_status(completed, "fractions")
+    assert status["completed_count"] == 2
+    assert status["next_item_id"] == "FRACTIONS-A-Q10"
+
+    # The most recent fractions item (A-Q2) decides; other topics in the list are ignored
+    recommended = service.recommend_next_session({"completed_items": completed}, "fractions")
+    assert recommended == "FRACTIONS-A-Q10"
+    assert service.recommend_next_session({"completed_items": []}, "fractions") == "FRACTIONS-A-Q2"
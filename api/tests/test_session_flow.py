@@ -1,7 +1,5 @@
 import json
 from pathlib import Path
-from fastapi.testclient import TestClient
-from main import app
 
 
 def load_sample():
@@ -10,8 +8,7 @@ def load_sample():
     return data
 
 
-def test_ingest_and_session_flow():
-    client = TestClient(app)
+def test_ingest_and_session_flow(client):
     # Ingest sample items
     data = load_sample()
     r = client.post("/v1/items/ingest", json=data)
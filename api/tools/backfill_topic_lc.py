@@ -0,0 +1,65 @@
+"""Backfill the normalized `topic_lc` field on existing curriculum questions.
+
+Usage:
+  python api/tools/backfill_topic_lc.py --project <PROJECT_ID>
+  python api/tools/backfill_topic_lc.py --project <PROJECT_ID> --dry-run
+
+New writes populate `topic_lc` automatically; this is a one-shot migration for
+documents stored before the field existed. Updates are committed in batches of
+500 (the Firestore per-batch write limit).
+
+Requires GOOGLE_APPLICATION_CREDENTIALS pointing to a service account JSON.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from services.firestore_repository import get_firestore_repository  # noqa: E402
+from models.curriculum_models import COLLECTIONS  # noqa: E402
+
+BATCH_SIZE = 500
+
+
+def backfill(project_id: str | None, dry_run: bool = False) -> int:
+    repo = get_firestore_repository(project_id)
+    db = repo.db
+    batch = db.batch()
+    pending = 0
+    updated = 0
+
+    for doc in db.collection(COLLECTIONS["curriculum_questions"]).stream():
+        data = doc.to_dict() or {}
+        topic = data.get("topic")
+        if not topic or data.get("topic_lc") == topic.lower():
+            continue
+        updated += 1
+        if dry_run:
+            continue
+        batch.update(doc.reference, {"topic_lc": topic.lower()})
+        pending += 1
+        if pending == BATCH_SIZE:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    if pending:
+        batch.commit()
+    return updated
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--project", dest="project_id", required=False)
+    p.add_argument("--dry-run", action="store_true", help="count documents without writing")
+    args = p.parse_args()
+
+    updated = backfill(args.project_id, dry_run=args.dry_run)
+    verb = "Would update" if args.dry_run else "Updated"
+    print(f"{verb} topic_lc on {updated} curriculum documents")
+
+
+if __name__ == "__main__":
+    main()
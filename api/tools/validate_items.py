@@ -1,29 +1,53 @@
 import argparse
 import json
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from jsonschema import validate, Draft202012Validator
+from jsonschema import Draft202012Validator
+
+
+@lru_cache(maxsize=None)
+def _validator(schema_path: str) -> Draft202012Validator:
+    """Parse and compile the schema once per process."""
+    return Draft202012Validator(json.loads(Path(schema_path).read_text()))
+
+
+def _validate_one(path: str, schema_path: str) -> list:
+    """(error path, message) pairs for one item file; empty when it is valid."""
+    data = json.loads(Path(path).read_text())
+    errors = sorted(_validator(schema_path).iter_errors(data), key=lambda e: e.path)
+    return [("/".join(map(str, e.path)), e.message) for e in errors]
 
 
 def main():
     parser = argparse.ArgumentParser(description="Validate Enhanced Item JSON against schema")
-    parser.add_argument("file", type=str, help="Path to enhanced item JSON file")
+    parser.add_argument("files", type=str, nargs="+", help="Path(s) to enhanced item JSON files")
     parser.add_argument("--schema", type=str, default=str(Path(__file__).parents[2] / "schemas" / "enhanced_item_v1.schema.json"))
+    parser.add_argument("--jobs", type=int, default=None, help="Worker processes for multi-file runs (default: CPU count)")
     args = parser.parse_args()
 
-    schema = json.loads(Path(args.schema).read_text())
-    data = json.loads(Path(args.file).read_text())
+    schemas = [args.schema] * len(args.files)
+    if len(args.files) > 1 and args.jobs != 1:
+        # Files are independent; each worker compiles the schema once and validates its share
+        with ProcessPoolExecutor(max_workers=args.jobs) as ex:
+            results = list(ex.map(_validate_one, args.files, schemas, chunksize=8))
+    else:
+        results = list(map(_validate_one, args.files, schemas))
+
+    failed = 0
+    for path, errors in zip(args.files, results):
+        prefix = f"{path}: " if len(args.files) > 1 else ""
+        if errors:
+            failed += 1
+            print(f"{prefix}Validation failed:")
+            for error_path, message in errors:
+                print(f"- {error_path}: {message}")
+        else:
+            print(f"{prefix}Validation OK")
 
-    validator = Draft202012Validator(schema)
-    errors = sorted(validator.iter_errors(data), key=lambda e: e.path)
-    if errors:
-        print("Validation failed:")
-        for e in errors:
-            print(f"- {'/'.join(map(str, e.path))}: {e.message}")
+    if failed:
         raise SystemExit(1)
-    else:
-        print("Validation OK")
 
 
 if __name__ == "__main__":
     main()
-
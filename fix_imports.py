@@ -2,31 +2,51 @@
 """
 Fix relative imports in the API to use absolute imports
 """
+import mmap
 import os
 import re
-from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+# API package root, resolved once as a plain string
+_API_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api')
+
+# All rewrites in one compiled pattern so each file is scanned once:
+# relative imports of any depth (., .., ...) and bare top-level package imports
+_IMPORT_PATTERN = re.compile(
+    r'from (?:\.{1,3}(?P<rel>[a-zA-Z0-9_]+) import|(?P<pkg>models|services|core|routers)\.)'
+)
+
+# Cheap substring prefilter: files containing none of these can't match _IMPORT_PATTERN
+_CANDIDATE_TOKENS = (b'from .', b'from models.', b'from services.', b'from core.', b'from routers.')
+
+def _has_candidate(file_path):
+    """True if the file contains any _CANDIDATE_TOKENS, checked on a read-only mmap (no decode)"""
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return False  # mmap can't map an empty file
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return any(mm.find(token) != -1 for token in _CANDIDATE_TOKENS)
+
+def _absolute_import(match):
+    """Replacement for one _IMPORT_PATTERN match"""
+    if match.group('pkg'):
+        return f"from api.{match.group('pkg')}."
+    return f"from api.{match.group('rel')} import"
 
 def fix_imports_in_file(file_path):
     """Fix relative imports in a single file"""
     try:
+        # Most files need no rewrite; only decode the ones that might
+        if not _has_candidate(file_path):
+            return False
+        
         with open(file_path, 'r') as f:
             content = f.read()
         
         original_content = content
         
         # Fix relative imports to absolute imports
-        patterns = [
-            (r'from \.([a-zA-Z0-9_]+) import', r'from api.\1 import'),
-            (r'from \.\.([a-zA-Z0-9_]+) import', r'from api.\1 import'),
-            (r'from \.\.\.([a-zA-Z0-9_]+) import', r'from api.\1 import'),
-            (r'from models\.', r'from api.models.'),
-            (r'from services\.', r'from api.services.'),
-            (r'from core\.', r'from api.core.'),
-            (r'from routers\.', r'from api.routers.'),
-        ]
-        
-        for pattern, replacement in patterns:
-            content = re.sub(pattern, replacement, content)
+        content = _IMPORT_PATTERN.sub(_absolute_import, content)
         
         # Only write if content changed
         if content != original_content:
@@ -40,20 +60,32 @@ def fix_imports_in_file(file_path):
         print(f"Error fixing {file_path}: {e}")
         return False
 
+# Directories never worth descending into
+_SKIP_DIRS = frozenset({'__pycache__', '.git', '.venv', 'node_modules'})
+
+def _walk_py(root):
+    """Yield .py file paths under root as plain strings (os.scandir, no Path objects)"""
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in _SKIP_DIRS:
+                        stack.append(entry.path)
+                elif entry.name.endswith('.py'):
+                    yield entry.path
+
 def main():
     """Fix all Python files in the api directory"""
-    api_dir = Path(__file__).parent / 'api'
-    
-    if not api_dir.exists():
-        print(f"API directory not found: {api_dir}")
+    if not os.path.isdir(_API_ROOT):
+        print(f"API directory not found: {_API_ROOT}")
         return
     
-    python_files = list(api_dir.rglob('*.py'))
-    fixed_count = 0
+    python_files = list(_walk_py(_API_ROOT))
     
-    for py_file in python_files:
-        if fix_imports_in_file(py_file):
-            fixed_count += 1
+    # Files are independent; rewrite them across worker processes
+    with ProcessPoolExecutor() as executor:
+        fixed_count = sum(executor.map(fix_imports_in_file, python_files, chunksize=16))
     
     print(f"\nFixed imports in {fixed_count} files")
 
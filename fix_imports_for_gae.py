@@ -4,39 +4,88 @@ Quick script to fix imports for GAE deployment
 Converts 'from api.' imports to relative imports when running from api directory
 """
 
+import argparse
+import mmap
 import os
 import re
-from pathlib import Path
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+# Default API package root (next to this script), as a plain string (no Path objects on the hot path)
+_API_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api')
+
+def _mentions_api(file_path):
+    """True if the file contains 'from api.', checked on a read-only mmap (no decode)"""
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return False  # mmap can't map an empty file
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return mm.find(b'from api.') != -1
 
 def fix_imports_in_file(file_path):
     """Fix imports in a single file"""
+    # Nothing to convert: skip the decode, the regex and the rewrite entirely
+    if not _mentions_api(file_path):
+        return
+    
     with open(file_path, 'r') as f:
         content = f.read()
     
     # Replace 'from api.' with relative imports
     # Pattern: from api.module import something
-    content = re.sub(r'from api\.', 'from ', content)
+    new_content = re.sub(r'from api\.', 'from ', content)
+    if new_content == content:
+        return
     
-    with open(file_path, 'w') as f:
-        f.write(content)
+    # Write beside the original, then swap in atomically so an interrupted run can't truncate it
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(new_content)
+    # The new file gets umask defaults; keep the original's permission bits
+    shutil.copymode(file_path, tmp_path)
+    os.replace(tmp_path, file_path)
     
     print(f"Fixed imports in: {file_path}")
 
+# Directories never worth descending into
+_SKIP_DIRS = frozenset({'__pycache__', '.git', '.venv', 'node_modules'})
+
+def _walk_py(root):
+    """Yield .py file paths under root as plain strings (os.scandir, no Path objects)"""
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in _SKIP_DIRS:
+                        stack.append(entry.path)
+                elif entry.name.endswith('.py'):
+                    yield entry.path
+
+def _fix_file(py_file):
+    """Worker entry point: fix one file, reporting rather than raising errors"""
+    try:
+        fix_imports_in_file(py_file)
+    except Exception as e:
+        print(f"Error fixing {py_file}: {e}")
+
 def main():
     """Fix all Python files in the api directory"""
-    api_dir = Path('/Users/farhat/Documents/AI Systems/AITutor/edilmai/edilmai/api')
+    parser = argparse.ArgumentParser(description="Convert 'from api.' imports for GAE deployment")
+    parser.add_argument("api_dir", nargs="?", default=_API_ROOT,
+                        help="API package directory to rewrite (default: ./api next to this script)")
+    api_dir = parser.parse_args().api_dir
+    
+    if not os.path.isdir(api_dir):
+        print(f"API directory not found: {api_dir}")
+        return
     
     # Find all Python files
-    python_files = list(api_dir.rglob('*.py'))
-    
-    for py_file in python_files:
-        if py_file.name == '__pycache__':
-            continue
-        
-        try:
-            fix_imports_in_file(py_file)
-        except Exception as e:
-            print(f"Error fixing {py_file}: {e}")
+    python_files = list(_walk_py(api_dir))
+    
+    # Files are independent; rewrite them across worker processes
+    with ProcessPoolExecutor() as executor:
+        list(executor.map(_fix_file, python_files, chunksize=16))
     
     print(f"Import fixing complete! Processed {len(python_files)} files")
 
@@ -2,23 +2,175 @@
 Complete all remaining subjects: percentage, ratio, speed, geometry, statistics
 """
 
+import asyncio
 import json
 import os
+import re
 import sys
-from typing import Dict, List, Any
+from typing import Any, Dict, Iterable, List, Tuple
 import google.generativeai as genai
 from datetime import datetime
 import time
 
+try:
+    import orjson
+except ImportError:
+    orjson = None  # Optional speedup; falls back to stdlib json
+
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 from api.core.config import settings
 
-def generate_subject(subject_key: str, spec: Dict[str, Any]) -> Dict[str, Any]:
+# Markdown code fence around the JSON payload (optional language tag, any surrounding whitespace)
+_FENCE = re.compile(r'^\s*```(?:json)?\s*\n?(.*?)\n?```\s*$', re.DOTALL)
+
+def load_json(text: str) -> Any:
+    """Parse JSON text, with orjson when available"""
+    return orjson.loads(text) if orjson else json.loads(text)
+
+def save_json(path: str, data: Any):
+    """Atomically write pretty-printed, non-ASCII-preserving JSON, with orjson when available"""
+    tmp_path = f'{path}.tmp'
+    if orjson:
+        with open(tmp_path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    else:
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+    # Readers (and an interrupted run) only ever see the previous or the new complete file
+    os.replace(tmp_path, path)
+
+# Concurrency limits shared by every subject's batches
+MAX_CONCURRENT_REQUESTS = 4
+MIN_REQUEST_INTERVAL = 1.2  # seconds between request starts (~50 requests/minute)
+
+# Ask Gemini for a bare JSON body so responses parse directly (fence stripping stays as a fallback)
+GENERATION_CONFIG = {'response_mime_type': 'application/json'}
+
+
+class RequestPacer:
+    """Spaces request starts at least `interval` seconds apart across all tasks"""
+    
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = asyncio.Lock()
+        self._next_start = 0.0
+    
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            if self._next_start > now:
+                await asyncio.sleep(self._next_start - now)
+            self._next_start = max(now, self._next_start) + self.interval
+
+
+def problem_number(problem: Dict[str, Any]) -> int:
+    """Position of a problem in its subject, from its '<SUBJECT>-S1-E<n>' id"""
+    return int(problem['id'].rsplit('-E', 1)[1])
+
+def missing_batches(saved: Iterable[int], target_problems: int, batch_size: int) -> List[Tuple[int, int]]:
+    """(start_idx, size) requests covering every problem number in 1..target_problems not yet saved.
+
+    Consecutive missing numbers are requested together, at most batch_size per request, so a
+    batch the model answered short is topped up with just its missing problems.
+    """
+    saved = set(saved)
+    requests: List[Tuple[int, int]] = []
+    for number in range(1, target_problems + 1):
+        if number in saved:
+            continue
+        if requests and requests[-1][0] + requests[-1][1] == number and requests[-1][1] < batch_size:
+            requests[-1] = (requests[-1][0], requests[-1][1] + 1)
+        else:
+            requests.append((number, 1))
+    return requests
+
+def prompt_sections(spec: Dict[str, Any]) -> Dict[str, str]:
+    """Bullet lists for the spec-derived prompt sections (identical for every batch of a subject)"""
+    return {
+        'objectives': '\n'.join(f"- {obj}" for obj in spec['learning_objectives']),
+        'skills': '\n'.join(f"- {skill}" for skill in spec['key_skills']),
+        'contexts': '\n'.join(f"- {context}" for context in spec['contexts']),
+    }
+
+async def generate_batch(model, subject_key: str, spec: Dict[str, Any], sections: Dict[str, str],
+                         start_idx: int, batch_size: int,
+                         semaphore: asyncio.Semaphore, pacer: RequestPacer) -> List[Dict[str, Any]]:
+    """Generate one batch of problems; returns [] if the batch fails"""
+    print(f"  🤖 Generating {spec['name']} problems {start_idx}-{start_idx + batch_size - 1}...")
+    
+    # Create AI prompt
+    system_prompt = f"""
+    You are an expert curriculum designer for Singapore Primary 6 Mathematics.
+    Generate {batch_size} high-quality math problems for the topic: {spec['name']}
+
+    CRITICAL REQUIREMENTS:
+    1. STRICTLY follow Singapore MOE Primary 6 Mathematics syllabus
+    2. Use natural, relatable contexts from everyday life
+    3. Progressive difficulty: Easy → Medium → Hard
+    4. Include Socratic questioning steps for guided learning
+    5. Problems must be appropriate for Singapore P6 students
+
+    OFFICIAL MOE LEARNING OBJECTIVES FOR {spec['name']}:
+    {sections['objectives']}
+
+    KEY SKILLS TO COVER:
+    {sections['skills']}
+
+    CONTEXTUAL SETTINGS (vary naturally):
+    {sections['contexts']}
+
+    OUTPUT FORMAT: Return ONLY valid JSON array with problems numbered starting from {start_idx}.
+    Each problem should have: id, topic, title, complexity, difficulty, skill, subskills, 
+    estimated_time_seconds, problem_text, student_view with socratic steps and hints.
+    """
+
+    user_prompt = f"""
+    Generate {batch_size} {spec['name']} problems #{start_idx} to #{start_idx + batch_size - 1}.
+    
+    Ensure variety in:
+    - Contexts (use different scenarios from the list)
+    - Skills covered (cycle through different operations)
+    - Difficulty levels (appropriate progression)
+    
+    Return ONLY the JSON array, no other text.
+    """
+    
+    try:
+        async with semaphore:
+            await pacer.wait()
+            # Stream the batch so tokens are consumed as they arrive rather than in one buffered read
+            response = await model.generate_content_async([system_prompt, user_prompt], stream=True)
+            content = ''.join([chunk.text async for chunk in response]).strip()
+        
+        # Clean up response: unwrap a markdown code fence if the model added one
+        fenced = _FENCE.match(content)
+        if fenced:
+            content = fenced.group(1).strip()
+            
+        # Extra problems would take ids belonging to the next batch
+        batch_problems = load_json(content)[:batch_size]
+        
+        # Basic validation and fix IDs
+        for i, problem in enumerate(batch_problems):
+            problem['id'] = f"{subject_key.upper()}-S1-E{start_idx + i}"
+            problem['topic'] = spec['name']
+            problem.setdefault('learn_step', ((start_idx + i - 1) // 10) + 1)
+            problem.setdefault('estimated_time_seconds', 60)
+        
+        print(f"    ✅ {spec['name']}: generated problems {start_idx}-{start_idx + len(batch_problems) - 1}")
+        return batch_problems
+        
+    except Exception as e:
+        print(f"    ❌ {spec['name']} batch {start_idx} failed: {e}")
+        # Continue with the other batches
+        return []
+
+async def generate_subject(subject_key: str, spec: Dict[str, Any], semaphore: asyncio.Semaphore,
+                           pacer: RequestPacer) -> Dict[str, Any]:
     """Generate complete curriculum for one subject"""
     
-    genai.configure(api_key=settings.google_api_key)
-    model = genai.GenerativeModel('gemini-2.5-flash')
+    model = genai.GenerativeModel('gemini-2.5-flash', generation_config=GENERATION_CONFIG)
     
     print(f"\n🚀 Generating {spec['name']} ({spec['target_problems']} problems)...")
     
@@ -34,89 +186,46 @@ def generate_subject(subject_key: str, spec: Dict[str, Any]) -> Dict[str, Any]:
         "items": []
     }
     
-    batch_size = 5
-    generated_count = 0
+    batch_size = 20  # fewer, larger requests: round trips dominate wall time
     start_time = time.time()
+    sections = prompt_sections(spec)
+    output_path = f'{subject_key}.json'
     
-    for start_idx in range(1, spec['target_problems'] + 1, batch_size):
-        current_batch_size = min(batch_size, spec['target_problems'] - generated_count)
-        
-        print(f"  🤖 Generating problems {start_idx}-{start_idx + current_batch_size - 1}...")
-        
-        # Create AI prompt
-        system_prompt = f"""
-        You are an expert curriculum designer for Singapore Primary 6 Mathematics.
-        Generate {current_batch_size} high-quality math problems for the topic: {spec['name']}
-
-        CRITICAL REQUIREMENTS:
-        1. STRICTLY follow Singapore MOE Primary 6 Mathematics syllabus
-        2. Use natural, relatable contexts from everyday life
-        3. Progressive difficulty: Easy → Medium → Hard
-        4. Include Socratic questioning steps for guided learning
-        5. Problems must be appropriate for Singapore P6 students
-
-        OFFICIAL MOE LEARNING OBJECTIVES FOR {spec['name']}:
-        {chr(10).join(f"- {obj}" for obj in spec['learning_objectives'])}
-
-        KEY SKILLS TO COVER:
-        {chr(10).join(f"- {skill}" for skill in spec['key_skills'])}
-
-        CONTEXTUAL SETTINGS (vary naturally):
-        {chr(10).join(f"- {context}" for context in spec['contexts'])}
-
-        OUTPUT FORMAT: Return ONLY valid JSON array with problems numbered starting from {start_idx}.
-        Each problem should have: id, topic, title, complexity, difficulty, skill, subskills, 
-        estimated_time_seconds, problem_text, student_view with socratic steps and hints.
-        """
-
-        user_prompt = f"""
-        Generate {current_batch_size} {spec['name']} problems #{start_idx} to #{start_idx + current_batch_size - 1}.
-        
-        Ensure variety in:
-        - Contexts (use different scenarios from the list)
-        - Skills covered (cycle through different operations)
-        - Difficulty levels (appropriate progression)
-        
-        Return ONLY the JSON array, no other text.
-        """
-        
-        try:
-            response = model.generate_content([system_prompt, user_prompt])
-            content = response.text.strip()
-            
-            # Clean up response
-            if content.startswith('```json'):
-                content = content[7:-3].strip()
-            elif content.startswith('```'):
-                content = content[3:-3].strip()
-                
-            batch_problems = json.loads(content)
-            
-            # Basic validation and fix IDs
-            for i, problem in enumerate(batch_problems):
-                problem['id'] = f"{subject_key.upper()}-S1-E{start_idx + i}"
-                problem['topic'] = spec['name']
-                problem.setdefault('learn_step', ((start_idx + i - 1) // 10) + 1)
-                problem.setdefault('estimated_time_seconds', 60)
-            
-            curriculum['items'].extend(batch_problems)
-            generated_count += len(batch_problems)
-            
-            print(f"    ✅ Generated {generated_count}/{spec['target_problems']} problems")
-            
-            # Brief pause between batches
-            time.sleep(1.2)
-            
-        except Exception as e:
-            print(f"    ❌ Batch failed: {e}")
-            # Continue with next batch
+    # Resume from a checkpoint left by an earlier run: saved problems are kept by number
+    problems: Dict[int, Dict[str, Any]] = {}
+    if os.path.exists(output_path):
+        with open(output_path, 'rb') as f:
+            previous = load_json(f.read())
+        curriculum['metadata']['generated_at'] = previous['metadata'].get('generated_at', curriculum['metadata']['generated_at'])
+        problems = {problem_number(problem): problem for problem in previous['items']}
+        print(f"  ♻️  Resuming {spec['name']}: {len(problems)} problems already saved")
+    
+    def checkpoint():
+        curriculum['items'] = [problems[number] for number in sorted(problems)]
+        save_json(output_path, curriculum)
+    
+    async def run_batch(start_idx: int, size: int) -> int:
+        batch_problems = await generate_batch(model, subject_key, spec, sections, start_idx, size,
+                                              semaphore, pacer)
+        if batch_problems:
+            # Persist after every successful batch so an interrupted run loses at most in-flight work
+            problems.update((problem_number(problem), problem) for problem in batch_problems)
+            checkpoint()
+        return len(batch_problems)
+    
+    # Missing problems (whole batches, or the tail of a batch answered short) are requested
+    # concurrently, bounded by the shared semaphore and pacer; items are saved in problem order
+    generated_count = sum(await asyncio.gather(*(
+        run_batch(start_idx, size)
+        for start_idx, size in missing_batches(problems, spec['target_problems'], batch_size)
+    )))
     
     # Final save
+    curriculum['items'] = [problems[number] for number in sorted(problems)]
     curriculum['metadata']['completed_at'] = datetime.now().isoformat()
     curriculum['metadata']['total_problems'] = len(curriculum['items'])
     
-    with open(f'{subject_key}.json', 'w') as f:
-        json.dump(curriculum, f, indent=2, ensure_ascii=False)
+    save_json(output_path, curriculum)
     
     generation_time = time.time() - start_time
     estimated_cost = (generated_count / 5) * 0.0027
@@ -128,6 +237,16 @@ def generate_subject(subject_key: str, spec: Dict[str, Any]) -> Dict[str, Any]:
     
     return curriculum
 
+async def generate_all(subjects: Dict[str, Dict[str, Any]]) -> List[Any]:
+    """Generate every subject concurrently; a failed subject yields its exception instead of a curriculum"""
+    genai.configure(api_key=settings.google_api_key)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    pacer = RequestPacer(MIN_REQUEST_INTERVAL)
+    return await asyncio.gather(
+        *(generate_subject(subject_key, spec, semaphore, pacer) for subject_key, spec in subjects.items()),
+        return_exceptions=True
+    )
+
 def main():
     """Generate all remaining subjects"""
     
@@ -245,19 +364,22 @@ def main():
     total_start_time = time.time()
     total_problems = 0
     total_cost = 0
+    item_counts: Dict[str, int] = {}
     
-    # Generate each subject
-    for subject_key, spec in subjects.items():
-        try:
-            curriculum = generate_subject(subject_key, spec)
-            total_problems += len(curriculum['items'])
-            total_cost += (len(curriculum['items']) / 5) * 0.0027
-            
-        except KeyboardInterrupt:
-            print(f"\n🛑 Generation stopped by user.")
-            break
-        except Exception as e:
-            print(f"❌ Failed to generate {subject_key}: {e}")
+    # Generate all subjects concurrently
+    try:
+        results = asyncio.run(generate_all(subjects))
+    except KeyboardInterrupt:
+        print(f"\n🛑 Generation stopped by user.")
+        results = []
+    
+    for subject_key, curriculum in zip(subjects, results):
+        if isinstance(curriculum, Exception):
+            print(f"❌ Failed to generate {subject_key}: {curriculum}")
+            continue
+        item_counts[subject_key] = len(curriculum['items'])
+        total_problems += item_counts[subject_key]
+        total_cost += (item_counts[subject_key] / 5) * 0.0027
     
     total_time = time.time() - total_start_time
     
@@ -267,13 +389,10 @@ def main():
     print(f"💰 Total estimated cost: ${total_cost:.4f}")
     print(f"🚀 Average rate: {total_problems/(total_time/60):.1f} problems/minute")
     
-    # List all generated files
+    # List all generated files (counts come from the returned curricula; no need to re-read them)
     print(f"\n📁 Generated Files:")
-    for subject_key in subjects.keys():
-        if os.path.exists(f"{subject_key}.json"):
-            with open(f"{subject_key}.json", 'r') as f:
-                data = json.load(f)
-                print(f"  ✅ {subject_key}.json - {len(data['items'])} problems")
+    for subject_key, count in item_counts.items():
+        print(f"  ✅ {subject_key}.json - {count} problems")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file